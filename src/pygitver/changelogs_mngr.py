@@ -1,18 +1,66 @@
+import hashlib
 import os
-import pathlib
 import json
+import re
+from typing import IO, Iterator
 from pygitver.git import Git, GitError
+from pygitver.json_stream import JsonStreamReader
+from pygitver.output import write_atomic
+from pygitver.renderers import (
+    TEMPLATE_CHANGELOG_COMMON,
+    iter_changelogs_service,
+    native_renderer,
+    render_changelogs,
+    render_changelogs_footer,
+    render_changelogs_header,
+    render_changelogs_service,
+)
 
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+FRAGMENTS_CACHE_FORMAT = "pygitver-fragments/1"
+PARTIAL_FORMAT = "pygitver-partial/1"
+# rendering of a service is cheap, a process pool pays off only for many
+# services
+PARALLEL_RENDER_MIN_SERVICES = 256
 
 
 class ChangelogsMngrError(Exception):
     pass
 
 
+class _StreamedSection:
+    """Changelog section of a service file, its entries are read from the file
+    on every iteration and are not kept in memory."""
+
+    def __init__(self, file_name: str, offset: int) -> None:
+        self._file_name = file_name
+        self._offset = offset
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, _entry) -> None:
+        self._count += 1
+
+    def __iter__(self) -> Iterator:
+        depth = 0
+        with open(self._file_name, "rb") as fp:
+            for event, value, _ in JsonStreamReader(
+                fp, self._offset, whole=False
+            ).events():
+                if event.startswith("start_"):
+                    depth += 1
+                elif event.startswith("end_"):
+                    depth -= 1
+                elif depth == 1:
+                    yield value
+
+
 class ChangelogsMngr:
     def __init__(self, changelogs_version: str = "0.0.1") -> None:
         self._changelogs_version = changelogs_version
+        # rendered services: {fragment key: text}
+        self._fragments: dict = {}
         self._init_changelog()
 
     def _init_changelog(self):
@@ -22,6 +70,9 @@ class ChangelogsMngr:
             "minor": False,
             "patch": False,
         }
+        # services are ordered by their sort keys (file names) when
+        # partial changelogs are merged
+        self._sort_keys: dict = {}
 
     def _update_bump_version_rules(self, service_name: str) -> None:
         for key in self._bump_version_rules.keys():
@@ -34,13 +85,323 @@ class ChangelogsMngr:
         for file_name in sorted(os.listdir(path)):
             try:
                 with open(os.path.join(path, file_name)) as fp:
+                    service_name = file_name
                     if file_ext and file_name.endswith(f".{file_ext}"):
-                        file_name = file_name[: -(len(file_ext) + 1)]
-                    self._changelogs["services"][file_name] = json.load(fp)
-                    self._update_bump_version_rules(file_name)
+                        service_name = file_name[: -(len(file_ext) + 1)]
+                    self._changelogs["services"][service_name] = json.load(fp)
+                    self._sort_keys[service_name] = file_name
+                    self._update_bump_version_rules(service_name)
             except json.JSONDecodeError:
                 # nothing to do, just skip invalid file
                 pass
+        self._bump_changelogs_version()
+        return self._changelogs
+
+    @staticmethod
+    def _scan_service_file(file_name: str) -> dict:
+        """
+        Parse a service changelog file as a stream and keep only the version,
+        bump rules and positions of the changelog sections in the file.
+
+        :param file_name: service changelog file
+        :return: dict with the service changelog, sections are read on
+            demand
+        """
+        service: dict = {
+            "bump_rules": {"major": False, "minor": False, "patch": False},
+            "changelog": {},
+        }
+        # keys of the open containers under the root and their types
+        path: tuple = ()
+        containers: list = []
+        key = ""
+        with open(file_name, "rb") as fp:
+            for event, value, offset in JsonStreamReader(fp).events():
+                if event == "value":
+                    if not path:
+                        if key == "version":
+                            service["version"] = value
+                    elif path == ("bump_rules",):
+                        service["bump_rules"][key] = value
+                    elif path == ("totals",):
+                        service.setdefault("totals", {})[key] = value
+                    elif len(path) == 2 and path[0] == "changelog":
+                        if containers[-1] == "start_array":
+                            service["changelog"][path[1]].append(value)
+                elif event == "key":
+                    key = str(value)
+                elif event.startswith("start_"):
+                    if not containers:
+                        if event != "start_map":
+                            raise json.JSONDecodeError("Expecting object", "", offset)
+                    else:
+                        if path == ("changelog",) and event == "start_array":
+                            service["changelog"][key] = _StreamedSection(
+                                file_name, offset
+                            )
+                        path += (key,)
+                    containers.append(event)
+                    key = ""
+                else:
+                    containers.pop()
+                    path = path[:-1] if containers else path
+        return service
+
+    def generate_stream(
+        self, path: str, fp: IO[str], file_ext: str = "json", template_name: str = ""
+    ) -> dict:
+        """
+        Generate the changelogs document from the services changelog files in
+        bounded memory (the bundled template only).
+
+        The files are parsed as a stream twice: the first pass gets the
+        bump rules (the changelogs version is in the document head), the
+        second one passes entries of every section straight to the
+        output.
+
+        :param path: directory with services changelog files
+        :param fp: text file object to write the document to
+        :param file_ext: extension of the changelog files
+        :param template_name: file name of the template
+        :return: dict with the changelogs version and services, their
+            sections are read from the files on demand
+        """
+        if not template_name:
+            template_name = os.getenv(
+                "PYGITVER_TEMPLATE_CHANGELOG_COMMON", TEMPLATE_CHANGELOG_COMMON
+            )
+        if native_renderer(template_name) is not render_changelogs:
+            raise ChangelogsMngrError(
+                "ERROR: Only the built-in changelogs layout can be streamed."
+            )
+
+        self._init_changelog()
+        for file_name in sorted(os.listdir(path)):
+            try:
+                service = self._scan_service_file(os.path.join(path, file_name))
+            except json.JSONDecodeError:
+                # nothing to do, just skip invalid file
+                continue
+            if file_ext and file_name.endswith(f".{file_ext}"):
+                file_name = file_name[: -(len(file_ext) + 1)]
+            self._changelogs["services"][file_name] = service
+            self._update_bump_version_rules(file_name)
+        self._bump_changelogs_version()
+
+        fp.write(render_changelogs_header(self._changelogs))
+        for service_name, service in self._changelogs["services"].items():
+            for part in iter_changelogs_service(service_name, service):
+                fp.write(part)
+        return self._changelogs
+
+    @staticmethod
+    def _service_name(tag: str) -> str:
+        """
+        Get a service name from the release tag, for example, tag
+        "service_a_1.2.3", the service is "service_a".
+
+        :param tag: release git tag
+        :return: string with the service name, the tag itself if it has
+            no service prefix
+        """
+        search_res = re.search(r"^(.*?)[-_]?v?\d+\.\d+\.\d+(?:-[a-zA-Z\d.]+)?$", tag)
+        return search_res.group(1) if search_res and search_res.group(1) else tag
+
+    def read_notes(self, tags: list):
+        """
+        Read changelogs of services' releases stored in git notes (see 'git
+        notes --ref=refs/notes/pygitver') instead of walking the history.
+
+        :param tags: list of release git tags, one per service
+        :return: dict with joined changelogs
+        """
+        self._init_changelog()
+        for tag in tags:
+            note = Git.changelog_note_read(tag)
+            if note is None:
+                raise ChangelogsMngrError(
+                    f"ERROR: Changelog of '{tag}' is not stored in git notes."
+                )
+            service_name = self._service_name(tag)
+            self._changelogs["services"][service_name] = note["changelog_group"]
+            self._update_bump_version_rules(service_name)
+        self._bump_changelogs_version()
+        return self._changelogs
+
+    def partial(self) -> dict:
+        """
+        Get the partial aggregate of the read services: it is merged with
+        partials of other services (for example, read on other machines) by
+        'merge_partials'.
+
+        :return: dict {"format": ..., "services": {...}, "sort_keys":
+            {service name: file name}, "bump_rules": {...}}, the bump
+            rules are OR-ed rules of the services
+        """
+        services = self._changelogs["services"]
+        return {
+            "format": PARTIAL_FORMAT,
+            "services": services,
+            "sort_keys": {
+                service_name: self._sort_keys.get(service_name, service_name)
+                for service_name in services.keys()
+            },
+            "bump_rules": dict(self._bump_version_rules),
+        }
+
+    @staticmethod
+    def merge_partials(partials: list) -> dict:
+        """
+        Merge partial aggregates, the merge is associative and commutative:
+        partials may be merged in any grouping (as a tree) and order, the
+        result is the same as one 'read_files' over all the services files.
+
+        :param partials: list with partial aggregates (see 'partial')
+        :return: dict with the merged partial aggregate
+        """
+        services: dict = {}
+        sort_keys: dict = {}
+        bump_rules: dict = {"major": False, "minor": False, "patch": False}
+        for partial in partials:
+            for service_name, service in partial["services"].items():
+                if service_name in services:
+                    raise ChangelogsMngrError(
+                        f"ERROR: Service '{service_name}' is in several "
+                        "partial changelogs."
+                    )
+                services[service_name] = service
+                sort_keys[service_name] = partial["sort_keys"].get(
+                    service_name, service_name
+                )
+            for key in bump_rules.keys():
+                bump_rules[key] |= bool(partial["bump_rules"].get(key))
+        order = sorted(services.keys(), key=sort_keys.__getitem__)
+        return {
+            "format": PARTIAL_FORMAT,
+            "services": {
+                service_name: services[service_name] for service_name in order
+            },
+            "sort_keys": {
+                service_name: sort_keys[service_name] for service_name in order
+            },
+            "bump_rules": bump_rules,
+        }
+
+    @staticmethod
+    def read_partial(file_name: str) -> dict:
+        """
+        Read a partial aggregate (the partial JSON output of 'changelogs').
+
+        :param file_name: file with the partial aggregate
+        :return: dict with the partial aggregate
+        """
+        try:
+            with open(file_name) as fp:
+                partial = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            partial = None
+        if not isinstance(partial, dict) or partial.get("format") != PARTIAL_FORMAT:
+            raise ChangelogsMngrError(
+                f"ERROR: Partial changelogs '{file_name}' are not valid."
+            )
+        return partial
+
+    def read_partials(self, file_names: list) -> dict:
+        """
+        Read and merge partial aggregates.
+
+        :param file_names: list of files with partial aggregates
+        :return: dict with joined changelogs, the same as 'read_files'
+            over all the services files
+        """
+        self._init_changelog()
+        merged = self.merge_partials(
+            [self.read_partial(file_name) for file_name in file_names]
+        )
+        self._changelogs["services"] = merged["services"]
+        self._sort_keys = merged["sort_keys"]
+        self._bump_version_rules = merged["bump_rules"]
+        self._bump_changelogs_version()
+        return self._changelogs
+
+    @staticmethod
+    def read_previous(file_name: str) -> dict:
+        """
+        Read the previous aggregated changelogs (JSON output of 'changelogs').
+
+        :param file_name: file with the previous changelogs
+        :return: dict with the previous changelogs
+        """
+        try:
+            with open(file_name) as fp:
+                previous = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            previous = None
+        if not isinstance(previous, dict) or "version" not in previous:
+            raise ChangelogsMngrError(
+                f"ERROR: Previous changelogs '{file_name}' are not valid."
+            )
+        return previous
+
+    @staticmethod
+    def _service_hash(service: dict) -> str:
+        """
+        Get a hash of the service version and changelog.
+
+        :param service: dictionary with the service changelog
+        :return: string with the hash
+        """
+        content = json.dumps(
+            [service.get("version"), service.get("changelog")],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def delta(self, previous: dict) -> dict:
+        """
+        Keep only services whose version or changelog changed since the
+        previous aggregated release, the rest are listed in "unchanged".
+
+        The version is the previous one bumped by the changed services
+        only, "hashes" of all services are kept for the next release.
+
+        :param previous: dict with the previous changelogs (result of
+            'read_files' or 'delta')
+        :return: dict with changelogs of the changed services
+        """
+        previous_hashes = {
+            service_name: self._service_hash(service)
+            for service_name, service in previous.get("services", {}).items()
+        }
+        previous_hashes.update(previous.get("hashes", {}))
+
+        services = self._changelogs["services"]
+        hashes = {
+            service_name: self._service_hash(service)
+            for service_name, service in services.items()
+        }
+        self._changelogs = {
+            "version": previous["version"],
+            "services": {
+                service_name: service
+                for service_name, service in services.items()
+                if previous_hashes.get(service_name) != hashes[service_name]
+            },
+            "unchanged": {
+                service_name: service.get("version")
+                for service_name, service in services.items()
+                if previous_hashes.get(service_name) == hashes[service_name]
+            },
+            "hashes": hashes,
+        }
+        self._bump_version_rules = dict.fromkeys(self._bump_version_rules, False)
+        for service_name in self._changelogs["services"].keys():
+            self._update_bump_version_rules(service_name)
+        self._bump_changelogs_version()
+        return self._changelogs
+
+    def _bump_changelogs_version(self) -> None:
         try:
             self._changelogs["version"] = Git.bump_version(
                 self._changelogs["version"],
@@ -48,15 +409,136 @@ class ChangelogsMngr:
             )
         except GitError:  # pragma: no cover
             self._changelogs["version"] = None
-        return self._changelogs
 
-    def generate(self, template_name: str = "") -> str:
+    @staticmethod
+    def _fragment_key(template_hash: str, service_name: str, service: dict) -> str:
+        """
+        Get a key of the rendered service changelog.
+
+        :param template_hash: hash of the template
+        :param service_name: name of the service
+        :param service: dictionary with the service changelog
+        :return: string with the hash of the template and the service
+            JSON
+        """
+        service_json = json.dumps(
+            [service_name, service], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(f"{template_hash}\n{service_json}".encode()).hexdigest()
+
+    def _fragments_cache_read(self, cache_file: str) -> None:
+        """
+        Load rendered services from the cache file, a missing or invalid file
+        is ignored.
+
+        :param cache_file: file name of the cache
+        """
+        try:
+            with open(cache_file) as fp:
+                cache = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if not isinstance(cache, dict) or cache.get("format") != FRAGMENTS_CACHE_FORMAT:
+            return
+        if isinstance(cache.get("fragments"), dict):
+            self._fragments.update(cache["fragments"])
+
+    @staticmethod
+    def _render_services(services: list, jobs: int = 1) -> list:
+        """
+        Render services changelogs, in a process pool if there are many of
+        them.
+
+        :param services: list of tuples (service name, service
+            changelog)
+        :param jobs: number of worker processes
+        :return: list with rendered services in the same order
+        """
+        if jobs <= 1 or len(services) < PARALLEL_RENDER_MIN_SERVICES:
+            return [render_changelogs_service(name, value) for name, value in services]
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(
+                executor.map(
+                    render_changelogs_service,
+                    [name for name, _ in services],
+                    [value for _, value in services],
+                    chunksize=max(1, len(services) // (jobs * 4)),
+                )
+            )
+
+    def _generate_fragments(
+        self, template_name: str, cache_file: str = "", jobs: int = 1
+    ) -> str:
+        """
+        Generate the changelogs from rendered services, only services changed
+        since the previous run (not found in the cache) are rendered.
+
+        :param template_name: file name of the bundled template
+        :param cache_file: file name to keep rendered services between
+            runs, in memory only if empty
+        :param jobs: number of worker processes
+        :return: string with formatted changelogs
+        """
+        with open(template_name, "rb") as fp:
+            template_hash = hashlib.sha256(fp.read()).hexdigest()
+        if cache_file:
+            self._fragments_cache_read(cache_file)
+
+        keys = [
+            self._fragment_key(template_hash, name, value)
+            for name, value in self._changelogs["services"].items()
+        ]
+        missing = {
+            key: item
+            for key, item in zip(keys, self._changelogs["services"].items())
+            if key not in self._fragments
+        }
+        self._fragments.update(
+            zip(missing.keys(), self._render_services(list(missing.values()), jobs))
+        )
+        # keep only the services of the last document
+        changed = bool(missing) or len(self._fragments) != len(set(keys))
+        self._fragments = {key: self._fragments[key] for key in keys}
+        if cache_file and changed:
+            write_atomic(
+                cache_file,
+                json.dumps(
+                    {"format": FRAGMENTS_CACHE_FORMAT, "fragments": self._fragments}
+                ),
+            )
+        header = render_changelogs_header(self._changelogs)
+        footer = render_changelogs_footer(self._changelogs)
+        return header + "".join(self._fragments[key] for key in keys) + footer
+
+    def generate(
+        self, template_name: str = "", cache_file: str = "", jobs: int = 1
+    ) -> str:
+        """
+        Generate the changelogs document.
+
+        The bundled template is rendered per service: rendered services
+        are cached by the hash of the service changelog and the
+        template, changed ones are rendered in parallel. Custom
+        templates are rendered by Jinja2 as a whole.
+
+        :param template_name: file name with changelog template in
+            Jinja2 format
+        :param cache_file: file name to keep rendered services between
+            runs
+        :param jobs: number of worker processes
+        :return: string with formatted changelogs
+        """
         if not template_name:
-            script_directory = pathlib.Path(__file__).parent.resolve()
             template_name = os.getenv(
-                "PYGITVER_TEMPLATE_CHANGELOG_COMMON",
-                f"{script_directory}/templates/changelog-common.tmpl",
+                "PYGITVER_TEMPLATE_CHANGELOG_COMMON", TEMPLATE_CHANGELOG_COMMON
             )
+        if native_renderer(template_name) is render_changelogs:
+            return self._generate_fragments(TEMPLATE_CHANGELOG_COMMON, cache_file, jobs)
+
+        from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
         try:
             env = Environment(loader=FileSystemLoader(os.path.dirname(template_name)))
             template = env.get_template(os.path.basename(template_name))
@@ -1,9 +1,17 @@
 import os
-import pathlib
 import json
+import mmap
 import re
 import subprocess
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+import sys
+import tempfile
+from array import array
+from collections import deque
+from itertools import islice
+from typing import IO, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+from pygitver.output import write_atomic
+from pygitver.refs import RefsReader, RefsReaderError
+from pygitver.renderers import TEMPLATE_CHANGELOG, native_renderer
 
 
 class GitError(Exception):
@@ -21,23 +29,285 @@ RE_CONVENTIONAL_COMMIT = (
     r")"
 )
 
+RE_COMMIT_BREAKING = re.compile(
+    r"(^.*!:.+)|(^breaking change)|(^deprecated.*)|(.*:.*breaking change:.*)",
+    re.IGNORECASE,
+)
+RE_COMMIT_HEADER = re.compile(
+    r"^(?P<type>BREAKING CHANGE|[a-z]+)[\s\t]*(?:\((?P<scope>[^\:)]+)\))?[\s\t]*!?:",
+    re.IGNORECASE,
+)
+RE_COMMIT_SECTIONS = (
+    ("deprecations", re.compile("^deprecated.*:", re.IGNORECASE)),
+    ("features", re.compile("^feat.*:", re.IGNORECASE)),
+    ("bugfixes", re.compile("^fix.*:", re.IGNORECASE)),
+    ("docs", re.compile("^docs.*:", re.IGNORECASE)),
+)
+RE_CONVENTIONAL_COMMIT_COMPILED = re.compile(RE_CONVENTIONAL_COMMIT, re.IGNORECASE)
+RE_CHECK_COMMIT_MESSAGE = re.compile(
+    f"{RE_CONVENTIONAL_COMMIT}([^\\s\\t]+)", re.IGNORECASE
+)
+RE_VERSION = re.compile(r"^[a-z\-_]*\d+\.\d+\.\d+(?:-[a-zA-Z\d.]+)?$")
+
+# version part which is bumped by a commit of the section (major is
+# bumped by breaking changes of any section)
+SECTION_BUMP_RULES = {
+    "features": "minor",
+    "bugfixes": "patch",
+    "deprecations": "",
+    "others": "patch",
+    "docs": "patch",
+    "non_conventional_commit": "patch",
+}
+
+LOG_FIELD_SEPARATOR = "\x1f"
+
+# classification of a commit takes microseconds, a process pool pays off
+# only for long ranges
+PARALLEL_CLASSIFY_MIN_COMMITS = 50000
+
+# number of candidate tags checked one by one for the reachability from HEAD
+# (a git process per check) before checking all the remaining tags with a
+# single 'git tag --merged HEAD': a newer tag of a release branch does not
+# cost the full check
+REACHABILITY_CHECKS = 2
+
+NOTES_REF = "refs/notes/pygitver"
+# a note is attached to the tagged commit ('<tag>^{commit}', not to the object
+# of an annotated tag), tags of the same commit (for example, releases of
+# several services) share it: {"format": ..., "tags": {tag: changelog}}
+NOTES_FORMAT = "pygitver-changelog/2"
+
 
 CURRENT_VERSION_DEFAULT = "v0.0.0"
 
+# resolved tags and current versions kept between runs in the git directory
+VERSION_CACHE_FILE = "pygitver-cache.json"
+VERSION_CACHE_FORMAT = "pygitver-cache/1"
+
+
+class Commit(NamedTuple):
+    """Parsed commit message, 'sha' is set only for the records of
+    'changelog_records', changelog sections keep the subject and the scope."""
+
+    sha: str
+    type: Optional[str]
+    scope: Optional[str]
+    breaking: bool
+    subject: str
+
+
+class ChangelogSection(list):
+    """
+    Changelog section: a list of entries (JSON and templates see it as a plain
+    list) which also keeps the conventional commit scope of every entry.
+
+    Scopes are stored as a column of small ids of the section scopes (2
+    bytes per entry), it is not allocated until the first entry with a
+    scope. The scope->entries index is built from it on the first access
+    and kept until the section is changed.
+
+    A capped section keeps only the first or the last 'max_entries'
+    entries, 'total' counts all added entries. The last entries are kept
+    in a bounded deque and moved to the list by 'finish'.
+
+    Unique entries are checked with a set of all distinct added entries,
+    the dropped ones of a capped section too, so its memory grows with
+    the number of distinct entries, not with 'max_entries'.
+    """
+
+    __slots__ = (
+        "_scope_ids",
+        "_scope_table",
+        "_seen",
+        "_max_entries",
+        "_keep",
+        "_total",
+        "_tail",
+        "_scopes_index",
+    )
+
+    def __init__(
+        self,
+        entries=(),
+        scopes=None,
+        max_entries: Optional[int] = None,
+        keep: str = "first",
+    ) -> None:
+        super().__init__()
+        # scope id of every entry, None while all the scopes are empty
+        self._scope_ids: Optional[array] = None
+        # {scope: id}, ids are in the order of the scopes
+        self._scope_table: dict = {"": 0}
+        self._seen: Optional[set] = None
+        self._max_entries = max_entries
+        self._keep = keep
+        self._total = 0
+        # (entry, scope) of the last entries while a section capped with
+        # keep="last" is filled
+        self._tail: Optional[deque] = None
+        self._scopes_index: Optional[dict] = None
+        for entry, scope in zip(entries, scopes if scopes else [""] * len(entries)):
+            self.add(entry, unique=False, scope=sys.intern(scope))
+        self.finish()
+
+    @property
+    def entry_scopes(self) -> list:
+        """
+        Get the conventional commit scope of every entry.
+
+        :return: list of scopes in the order of the entries
+        """
+        if self._scope_ids is None:
+            return [""] * len(self)
+        names = list(self._scope_table.keys())
+        return [names[scope_id] for scope_id in self._scope_ids]
+
+    def _push_scope(self, scope: str) -> None:
+        """
+        Add the scope of the last added entry to the scopes column.
+
+        :param scope: conventional commit scope
+        """
+        self._scopes_index = None
+        if self._scope_ids is None:
+            if not scope:
+                return
+            self._scope_ids = array("H", bytes(2 * (len(self) - 1)))
+        scope_id = self._scope_table.setdefault(scope, len(self._scope_table))
+        if scope_id > 0xFFFF and self._scope_ids.typecode == "H":
+            self._scope_ids = array("L", self._scope_ids)
+        self._scope_ids.append(scope_id)
+
+    @property
+    def total(self) -> int:
+        """
+        Get the number of entries added to the section, including entries
+        dropped by the cap.
+
+        :return: number of entries
+        """
+        return max(self._total, len(self))
+
+    def add(self, entry: str, unique: bool, scope: str = "") -> bool:
+        """
+        Add an entry to the section.
+
+        :param entry: changelog entry (commit message)
+        :param unique: do not add duplicates if it is True
+        :param scope: conventional commit scope, empty string if there is
+            no scope
+        :return: True if the entry was added (or counted in a capped
+            section)
+        """
+        if unique and self._seen is None:
+            self._seen = set(self)
+            if self._tail is not None:
+                self._seen.update(tail_entry for tail_entry, _ in self._tail)
+        if self._seen is not None:
+            if unique and entry in self._seen:
+                return False
+            self._seen.add(entry)
+        self._total = self.total + 1
+        if self._max_entries is not None:
+            if self._keep == "last":
+                if self._tail is None:
+                    self._tail = deque(maxlen=self._max_entries)
+                self._tail.append((entry, scope))
+                return True
+            if len(self) >= self._max_entries:
+                return True
+        self.append(entry)
+        self._push_scope(scope)
+        return True
+
+    def finish(self) -> None:
+        """Move the last entries of a section capped with keep="last" to the
+        list, the older entries are dropped."""
+        if not self._tail:
+            return
+        tail, self._tail = self._tail, None
+        self._scopes_index = None
+        drop = len(self) + len(tail) - (self._max_entries or 0)
+        if drop > 0:
+            del self[:drop]
+            if self._scope_ids is not None:
+                del self._scope_ids[:drop]
+        for entry, scope in tail:
+            self.append(entry)
+            self._push_scope(scope)
+
+    def merge(self, other: list, unique: bool) -> None:
+        """
+        Add all entries of another section (keeping its order and scopes).
+
+        :param other: section to add, scopes of a plain list are empty
+        :param unique: do not add duplicates if it is True
+        """
+        if isinstance(other, ChangelogSection):
+            other.finish()
+        scopes = (
+            other.entry_scopes
+            if isinstance(other, ChangelogSection)
+            else [""] * len(other)
+        )
+        if not unique and self._seen is None and self._max_entries is None:
+            total = self.total
+            for entry, scope in zip(other, scopes):
+                self.append(entry)
+                self._push_scope(scope)
+            self._total = total + len(other)
+            return
+        for entry, scope in zip(other, scopes):
+            self.add(entry, unique, scope)
+
+    @property
+    def scopes(self) -> dict:
+        """
+        Get the section entries grouped by the conventional commit scope.
+
+        :return: dict, example: {"api": ["new api"], "": ["no scope
+            commit"]}
+        """
+        if self._scopes_index is None:
+            res: dict = {}
+            for entry, scope in zip(self, self.entry_scopes):
+                res.setdefault(scope, []).append(entry)
+            self._scopes_index = res
+        return self._scopes_index
+
+    def __reduce__(self):
+        self.finish()
+        state = {
+            "_scope_ids": self._scope_ids,
+            "_scope_table": self._scope_table,
+            "_seen": self._seen,
+            "_max_entries": self._max_entries,
+            "_keep": self._keep,
+            "_total": self._total,
+            "_tail": None,
+            "_scopes_index": None,
+        }
+        return self.__class__, (), (None, state), iter(self)
+
 
 class Git:
     __version__ = "0.2.3"
+    # keep resolved tags and current versions in 'VERSION_CACHE_FILE'
+    use_cache = False
 
     @staticmethod
-    def _cmd(command: str) -> str:
+    def _cmd(command: str, input_text: Optional[str] = None) -> str:
         """
         Run a shell command, used for running git commands.
 
         :param command: string with shell command
+        :param input_text: string to send to the shell stdin
         :return: string with the raw output of the shell stdout
         """
         subprocess_res = subprocess.run(
             list(filter(lambda x: x, command.split(" "))),
+            input=input_text.encode("utf-8") if input_text is not None else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
         )
@@ -48,6 +318,47 @@ class Git:
             )  # pragma: no cover
         return output
 
+    @staticmethod
+    def _cmd_stream(command: str) -> Iterator[str]:
+        """
+        Run a shell command and read its output line by line while it is
+        running, used for long git outputs.
+
+        :param command: string with shell command
+        :return: iterator over the lines of the shell stdout (without
+            line endings)
+        """
+        # stderr goes to a file: a pipe read only after stdout could fill
+        # up and block the process
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                list(filter(lambda x: x, command.split(" "))),
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+            )
+            assert process.stdout is not None
+            finished = False
+            try:
+                for line in process.stdout:
+                    yield line.decode("utf-8").rstrip("\n")
+                finished = True
+            finally:
+                # a consumer which stops early does not need the rest
+                if not finished:
+                    process.kill()
+                process.stdout.close()
+                process.wait()
+            if 0 != process.returncode:
+                stderr.seek(0)
+                raise GitError(
+                    json.dumps(
+                        {
+                            "return_code": process.returncode,
+                            "result": stderr.read().decode("utf-8", "replace"),
+                        }
+                    )
+                )  # pragma: no cover
+
     @classmethod
     def _commit_msg_normalize(cls, commit: str) -> str:
         """
@@ -57,15 +368,11 @@ class Git:
         :param commit: string with the commit message
         :return: string with the normalized commit message
         """
-        return (
-            re.sub(RE_CONVENTIONAL_COMMIT, "", commit, flags=re.IGNORECASE)
-            .rstrip()
-            .lstrip()
-        )
+        return RE_CONVENTIONAL_COMMIT_COMPILED.sub("", commit).rstrip().lstrip()
 
     @staticmethod
     def _append_commit_to_section(
-        section: list, _commit_normalized: str, _unique: bool
+        section: list, _commit_normalized: str, _unique: bool, _scope: str = ""
     ) -> None:
         """
         Append a commit to the required section.
@@ -74,16 +381,67 @@ class Git:
             (normalized or as is)
         :param _commit_normalized: Normalize commit message if True
         :param _unique: do not add duplicates if it is True
+        :param _scope: conventional commit scope of the commit
         """
-        if _unique:
+        if isinstance(section, ChangelogSection):
+            section.add(_commit_normalized, _unique, _scope)
+        elif _unique:
             if _commit_normalized not in section:
                 section.append(_commit_normalized)
         else:
             section.append(_commit_normalized)
 
+    @staticmethod
+    def _commit_classify(commit: str) -> Tuple[str, bool]:
+        """
+        Classify a commit message.
+
+        :param commit: string with the commit message
+        :return: tuple with the changelog section name and True if the
+            commit is a breaking change
+        """
+        breaking = bool(RE_COMMIT_BREAKING.search(commit))
+        for section, re_section in RE_COMMIT_SECTIONS:
+            if re_section.search(commit):
+                return section, breaking
+        if not RE_CONVENTIONAL_COMMIT_COMPILED.search(commit):
+            return "non_conventional_commit", breaking
+        return "others", breaking
+
+    @classmethod
+    def _commit_parse(
+        cls, commit: str, commit_wo_prefix: bool, sha: str = ""
+    ) -> Tuple[str, Commit]:
+        """
+        Classify a commit message and parse it to a compact record.
+
+        :param commit: string with the commit message (subject)
+        :param commit_wo_prefix: remove commit pygitver prefix if it is
+            True
+        :param sha: commit hash if it is known
+        :return: tuple with the changelog section name and the commit
+            record
+        """
+        section, breaking = cls._commit_classify(commit)
+        header = RE_COMMIT_HEADER.match(commit)
+        scope = header.group("scope") if header else None
+        return section, Commit(
+            sha=sha,
+            type=header.group("type").lower() if header else None,
+            scope=sys.intern(scope.strip()) if scope else None,
+            breaking=breaking,
+            subject=cls._commit_msg_normalize(commit) if commit_wo_prefix else commit,
+        )
+
     @classmethod
     def _changelog_group_sort(
-        cls, git_log: str, commit_wo_prefix: bool, unique: bool
+        cls,
+        git_log: str,
+        commit_wo_prefix: bool,
+        unique: bool,
+        jobs: int = 1,
+        max_entries: Optional[int] = None,
+        keep: str = "first",
     ) -> dict:
         """
         Sort changes log by groups (features, bugfixes, deprecations, docs,
@@ -93,63 +451,140 @@ class Git:
             commit)
         :param unique: do not show duplicates commit if True
         :param commit_wo_prefix: remove commit pygitver prefix if it is True
+        :param jobs: number of processes to classify commits, ranges
+            shorter than 'PARALLEL_CLASSIFY_MIN_COMMITS' and capped
+            sections are classified serially
+        :param max_entries: keep only 'max_entries' entries per section
+            (None - all entries), exact numbers of entries are in
+            'totals'
+        :param keep: "first" (the newest) or "last" (the oldest)
+            entries of a capped section
         :return: dict with commits sorted by groups and 'bump_rules',
             example: { "bump_rules": {"major": False, "minor": True,
             "patch": True}, "changelog": { 'features': [ 'feat(api)!:
             new api' ], 'bugfixes': [ 'fix: test fix 1', 'fix(api)!:
             test fix 2' ], 'deprecations': [], 'others': [], 'docs': [],
-            'non_conventional_commit': [] } }
+            'non_conventional_commit': [] } }, every section is a
+            'ChangelogSection' with the scope index ('scopes')
+        """
+        # capped sections are kept bounded in a single process
+        parallel = jobs > 1 and max_entries is None
+        if parallel and git_log.count("\n") >= PARALLEL_CLASSIFY_MIN_COMMITS:
+            return cls._changelog_group_sort_parallel(
+                git_log, commit_wo_prefix, unique, jobs
+            )
+        return cls._changelog_group_sort_commits(
+            git_log.rstrip().split("\n"), commit_wo_prefix, unique, max_entries, keep
+        )
+
+    @classmethod
+    def _changelog_group_sort_commits(
+        cls,
+        commits: Iterable[str],
+        commit_wo_prefix: bool,
+        unique: bool,
+        max_entries: Optional[int] = None,
+        keep: str = "first",
+    ) -> dict:
+        """
+        Sort commit messages by groups (features, bugfixes, deprecations, docs,
+        others), the same as '_changelog_group_sort' for any iterable of commit
+        subjects, for example, read from a file on demand.
+
+        :param commits: iterable with commit subjects
+        :param commit_wo_prefix: remove commit pygitver prefix if it is
+            True
+        :param unique: do not show duplicates commit if True
+        :param max_entries: keep only 'max_entries' entries per section
+        :param keep: "first" or "last" entries of a capped section
+        :return: dict with commits sorted by groups and 'bump_rules',
+            capped sections add 'totals' {section: number of entries}
         """
         res: dict = {
-            "features": [],
-            "bugfixes": [],
-            "deprecations": [],
-            "others": [],
-            "docs": [],
-            "non_conventional_commit": [],
+            section: ChangelogSection(max_entries=max_entries, keep=keep)
+            for section in SECTION_BUMP_RULES
         }
         bump_rules: dict = {"major": False, "minor": False, "patch": False}
-        for commit in git_log.rstrip().split("\n"):
+        for commit in commits:
             commit = commit.rstrip()
             if len(commit) == 0:
                 continue
-            commit_normalized = (
-                cls._commit_msg_normalize(commit) if commit_wo_prefix else commit
+            section, record = cls._commit_parse(commit, commit_wo_prefix)
+            if record.breaking:
+                bump_rules["major"] = True
+            if SECTION_BUMP_RULES[section]:
+                bump_rules[SECTION_BUMP_RULES[section]] = True
+            cls._append_commit_to_section(
+                res[section], record.subject, unique, record.scope or ""
             )
-            if bool(
-                re.search(
-                    r"(^.*!:.+)|(^breaking change)|(^deprecated.*)|(.*:.*breaking change:.*)",
-                    commit,
-                    re.IGNORECASE,
-                )
+        if max_entries is None:
+            return {"bump_rules": bump_rules, "changelog": res}
+        for entries in res.values():
+            entries.finish()
+        totals = {section: entries.total for section, entries in res.items()}
+        return {"bump_rules": bump_rules, "changelog": res, "totals": totals}
+
+    @classmethod
+    def _changelog_group_sort_parallel(
+        cls, git_log: str, commit_wo_prefix: bool, unique: bool, jobs: int
+    ) -> dict:
+        """
+        Sort changes log by groups in a process pool: the log is split into
+        chunks of consecutive commits, the chunks are classified in parallel
+        and merged in the log order, so sections and 'unique' (the first commit
+        is kept) are the same as the serial result.
+
+        :param git_log: multiline string with commits (one line per
+            commit)
+        :param commit_wo_prefix: remove commit pygitver prefix if it is
+            True
+        :param unique: do not show duplicates commit if True
+        :param jobs: number of processes
+        :return: dict with commits sorted by groups and 'bump_rules'
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        commits = git_log.split("\n")
+        chunk_size = -(-len(commits) // (jobs * 4))
+        chunks = []
+        for pos in range(0, len(commits), chunk_size):
+            end = pos + chunk_size
+            chunks.append("\n".join(commits[pos:end]))
+        res: dict = {section: ChangelogSection() for section in SECTION_BUMP_RULES}
+        bump_rules: dict = {"major": False, "minor": False, "patch": False}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for chunk in executor.map(
+                cls._changelog_group_sort,
+                chunks,
+                [commit_wo_prefix] * len(chunks),
+                [unique] * len(chunks),
             ):
-                bump_rules["major"] = True
+                for key, value in chunk["bump_rules"].items():
+                    bump_rules[key] = bump_rules[key] or value
+                for section, entries in chunk["changelog"].items():
+                    res[section].merge(entries, unique)
+        return {"bump_rules": bump_rules, "changelog": res}
 
-            if bool(re.search("^deprecated.*:", commit, re.IGNORECASE)):
-                cls._append_commit_to_section(
-                    res["deprecations"], commit_normalized, unique
-                )
-            elif bool(re.search("^feat.*:", commit, re.IGNORECASE)):
-                cls._append_commit_to_section(
-                    res["features"], commit_normalized, unique
-                )
-                bump_rules["minor"] = True
-            elif bool(re.search("^fix.*:", commit, re.IGNORECASE)):
-                cls._append_commit_to_section(
-                    res["bugfixes"], commit_normalized, unique
-                )
-                bump_rules["patch"] = True
-            elif bool(re.search("^docs.*:", commit, re.IGNORECASE)):
-                cls._append_commit_to_section(res["docs"], commit_normalized, unique)
-                bump_rules["patch"] = True
-            elif not bool(re.search(RE_CONVENTIONAL_COMMIT, commit, re.IGNORECASE)):
-                cls._append_commit_to_section(
-                    res["non_conventional_commit"], commit_normalized, unique
-                )
-                bump_rules["patch"] = True
-            else:
-                cls._append_commit_to_section(res["others"], commit_normalized, unique)
-                bump_rules["patch"] = True
+    @classmethod
+    def _changelog_group_merge(cls, newer: dict, older: dict, unique: bool) -> dict:
+        """
+        Merge two results of '_changelog_group_sort', the 'newer' commits go
+        first in every section (the same order as 'git log' prints them).
+
+        :param newer: sorted changes log of the newer commits
+        :param older: sorted changes log of the older commits
+        :param unique: do not add duplicates if it is True
+        :return: dict with merged 'bump_rules' and 'changelog'
+        """
+        bump_rules = {
+            key: newer["bump_rules"][key] or older["bump_rules"][key]
+            for key in newer["bump_rules"].keys()
+        }
+        res: dict = {}
+        for section, commits in newer["changelog"].items():
+            res[section] = ChangelogSection()
+            res[section].merge(commits, unique)
+            res[section].merge(older["changelog"].get(section, []), unique)
         return {"bump_rules": bump_rules, "changelog": res}
 
     @staticmethod
@@ -176,14 +611,166 @@ class Git:
         """
         if update_from_remote:  # pragma: no cover
             cls._cmd("git fetch --all --tags")
-        branch = cls._cmd("git branch --show-current").strip("\r").strip("\n")
-        res = list(
-            filter(
-                None,
-                cls._cmd(f"git tag -l --sort=-v:refname --merged {branch}").split("\n"),
-            )
+        return cls._tags_merged(cls._refs())
+
+    @classmethod
+    def _tags_merged(cls, refs: Optional[RefsReader]) -> list:
+        """
+        Get git tags reachable from HEAD sorted in reverse order.
+
+        :param refs: refs reader of the caller (for the cache), None if
+            it is not supported
+        :return: list with git tags
+        """
+        return cls._cached(
+            ("tags",),
+            lambda: list(
+                filter(
+                    None,
+                    cls._cmd("git tag -l --sort=-v:refname --merged HEAD").split("\n"),
+                )
+            ),
+            refs,
         )
-        return res
+
+    @classmethod
+    def _cached(
+        cls, path: tuple, compute: Callable[[], object], refs: Optional[RefsReader]
+    ):
+        """
+        Get a value from the cache file in the git directory ('use_cache' is
+        True), the file is valid while the refs fingerprint is the same, a
+        missing value is computed and stored.
+
+        :param path: tuple with keys of the value in the cache, example:
+            ("versions", "v")
+        :param compute: function to compute the value
+        :param refs: refs reader of the caller, None if it is not
+            supported (the value is computed)
+        :return: the cached or computed value
+        """
+        if refs is None or not cls.use_cache:
+            return compute()
+        try:
+            fingerprint = refs.fingerprint()
+        except (RefsReaderError, OSError, UnicodeDecodeError):
+            return compute()
+        file_name = os.path.join(refs.git_dir, VERSION_CACHE_FILE)
+        try:
+            with open(file_name, "r") as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            data = None
+        header = {"format": VERSION_CACHE_FORMAT, "fingerprint": fingerprint}
+        if not isinstance(data, dict) or any(
+            data.get(key) != value for key, value in header.items()
+        ):
+            data = header
+        node = data
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        if path[-1] in node:
+            return node[path[-1]]
+        node[path[-1]] = value = compute()
+        try:
+            write_atomic(file_name, json.dumps(data))
+        except OSError:
+            pass
+        return value
+
+    @classmethod
+    def _tags_sorted(
+        cls, accept: Callable[[str], bool], refs: Optional[RefsReader]
+    ) -> Iterable[str]:
+        """
+        Get all git tags (reachable from HEAD or not) accepted by the filter
+        sorted in reverse version order.
+
+        :param accept: filter for the tags, it is applied once per tag
+            (lazily for the tags sorted by git)
+        :param refs: refs reader of the caller, None if it is not
+            supported (git is used)
+        :return: iterable over git tags
+        """
+        if refs is not None:
+            try:
+                return refs.tags_sorted(accept)
+            except (RefsReaderError, OSError, UnicodeDecodeError):
+                pass
+        tags = cls._cmd("git tag -l --sort=-v:refname").split("\n")
+        return (tag for tag in tags if tag and accept(tag))
+
+    @staticmethod
+    def _refs() -> Optional[RefsReader]:
+        """
+        Get a reader of the git refs files (fast path without running git).
+
+        :return: refs reader, None if the repository layout is not
+            supported by the reader
+        """
+        try:
+            return RefsReader()
+        except (RefsReaderError, OSError, UnicodeDecodeError):
+            return None
+
+    @classmethod
+    def _tag_reachable(cls, tag: str, refs: Optional[RefsReader]) -> bool:
+        """
+        Check if a git tag is reachable from HEAD.
+
+        :param tag: git tag
+        :param refs: refs reader of the caller, None if it is not
+            supported
+        :return: True if the tag is an ancestor of HEAD (or points to
+            HEAD)
+        """
+        if refs is not None:
+            try:
+                head = refs.head()
+                if head is not None and refs.peeled(tag) == head:
+                    return True
+            except (RefsReaderError, OSError, UnicodeDecodeError):
+                pass
+        try:
+            cls._cmd(f"git merge-base --is-ancestor {tag} HEAD")
+        except GitError:
+            return False
+        return True
+
+    @classmethod
+    def tags_reachable(
+        cls, accept: Callable[[str], bool] = lambda tag: True
+    ) -> Iterator[str]:
+        """
+        Get git tags reachable from HEAD in reverse version order lazily: the
+        newest 'REACHABILITY_CHECKS' candidates are checked one by one (a tag
+        of HEAD costs no git process in small repositories, otherwise a 'git
+        merge-base --is-ancestor' process), so a caller that needs only the
+        current version usually stops there, the rest are checked with a single
+        'git tag --merged HEAD'.
+
+        :param accept: filter for the candidate tags, it is applied
+            before the (more expensive) reachability check
+        :return: iterator over git tags
+        """
+        return cls._tags_reachable(accept, cls._refs())
+
+    @classmethod
+    def _tags_reachable(
+        cls, accept: Callable[[str], bool], refs: Optional[RefsReader]
+    ) -> Iterator[str]:
+        candidates = iter(cls._tags_sorted(accept, refs))
+        for tag in islice(candidates, REACHABILITY_CHECKS):
+            if cls._tag_reachable(tag, refs):
+                yield tag
+        merged: Optional[set] = None
+        for tag in candidates:
+            if merged is None:
+                # newer tags of other branches (e.g. release or hotfix
+                # branches), check all the rest at once
+                merged = set(cls._tags_merged(refs))
+            if tag in merged:
+                yield tag
 
     @classmethod
     def check_commit_message(cls, commit: str) -> bool:
@@ -193,9 +780,86 @@ class Git:
         :param commit: git commit message
         :return: True if the message is valid for Conventional Commits
         """
-        return bool(
-            re.match(f"{RE_CONVENTIONAL_COMMIT}([^\\s\\t]+)", commit, re.IGNORECASE)
-        )
+        return RE_CHECK_COMMIT_MESSAGE.match(commit) is not None
+
+    @staticmethod
+    def commit_message_cleanup(message: str, comment_char: str = "#") -> str:
+        """
+        Clean up a commit message file like git does before the commit: the
+        scissors line and everything below it, comment lines and trailing
+        whitespace are removed, consecutive empty lines are collapsed.
+
+        :param message: content of the commit message file
+        :param comment_char: git comment char ('core.commentChar')
+        :return: string with the commit message
+        """
+        scissors = f"{comment_char} {'-' * 24} >8 {'-' * 24}"
+        lines = []
+        for line in message.splitlines():
+            if line == scissors:
+                break
+            if not line.startswith(comment_char):
+                lines.append(line.rstrip())
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip("\n")
+
+    @staticmethod
+    def _read_nul_separated(fp: IO[bytes]) -> Iterator[bytes]:
+        read = getattr(fp, "read1", fp.read)
+        rest = b""
+        for chunk in iter(lambda: read(65536), b""):
+            items = (rest + chunk).split(b"\0")
+            rest = items.pop()
+            yield from items
+        if rest:
+            yield rest
+
+    @classmethod
+    def check_commit_messages(
+        cls, fp: IO[bytes], input_format: str = "ndjson"
+    ) -> Iterator[dict]:
+        """
+        Check a stream of commit messages, a verdict record is produced as soon
+        as a message is read.
+
+        :param fp: binary file object with messages
+        :param input_format: "ndjson" - a JSON string or an object
+            {"message": ..., "id": ...} per line, "nul" - messages
+            separated by NUL characters (surrounding whitespace is
+            ignored, 'git log --format=%B%x00' writes a newline after
+            every NUL)
+        :return: iterator with records {"index": ..., "id": ...,
+            "valid": ...}, "id" is set if it is in the input, invalid
+            input lines have "error"
+        """
+        if input_format == "nul":
+            index = 0
+            for data in cls._read_nul_separated(fp):
+                commit = data.decode("utf-8", "replace").strip()
+                if not commit:
+                    continue
+                yield {"index": index, "valid": cls.check_commit_message(commit)}
+                index += 1
+            return
+
+        index = 0
+        for line in iter(fp.readline, b""):
+            if not line.strip():
+                continue
+            record: dict = {"index": index}
+            index += 1
+            try:
+                item = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                item = None
+            if isinstance(item, dict) and "id" in item:
+                record["id"] = item["id"]
+            message = item.get("message") if isinstance(item, dict) else item
+            if isinstance(message, str):
+                record["valid"] = cls.check_commit_message(message)
+            else:
+                record["valid"] = False
+                record["error"] = "Expecting a JSON string or an object with 'message'"
+            yield record
 
     @classmethod
     def changelog(cls, start: str = "", end: str = "") -> str:
@@ -206,16 +870,97 @@ class Git:
         :param end: to git tag of HEAD by default
         :return: string with raw git log commit messages
         """
+        return cls._changelog_log(cls._changelog_range(start, end))
+
+    @classmethod
+    def _changelog_log(cls, log_range: str) -> str:
+        """
+        Get raw git log commit messages of a resolved range.
+
+        :param log_range: range from '_changelog_range'
+        :return: string with raw git log commit messages
+        """
+        return cls._cmd(
+            f"git log --pretty=format:%s {log_range}--no-merges"
+        )  # pragma: no cover
+
+    @classmethod
+    def _changelog_range(
+        cls, start: str = "", end: str = "", curr_ver: Optional[str] = None
+    ) -> str:
+        """
+        Get a git log commits range from the 'start' to the 'end' steps.
+
+        :param start: from git tag
+        :param end: to git tag of HEAD by default
+        :param curr_ver: the current version if the caller has already
+            resolved it, otherwise it is resolved
+        :return: string with the range for the 'git log' command (with a
+            trailing space) or empty string for the whole history
+        """
+        if curr_ver is None:
+            curr_ver = cls.version_current()
         if not start:
             start = cls._cmd("git log --pretty=format:%H --reverse -n 1")
         if not end:
             end = "HEAD"
-        git_commits_range = (
-            f"{start}...{end} " if "" != cls.version_current() else ""
-        )  # pragma: no cover
-        return cls._cmd(
-            f"git log --pretty=format:%s {git_commits_range}--no-merges"
-        )  # pragma: no cover
+        return f"{start}...{end} " if "" != curr_ver else ""  # pragma: no cover
+
+    @classmethod
+    def changelog_records(
+        cls, start: str = "", end: str = "HEAD", commit_wo_prefix: bool = True
+    ) -> Iterator[dict]:
+        """
+        Get a change log from the 'start' to the 'end' steps as a stream of
+        records, one record per commit as soon as it is classified and a
+        summary record at the end.
+
+        :param start: from git tag
+        :param end: to git tag of HEAD by default
+        :param commit_wo_prefix: remove commit pygitver prefixes if True
+        :return: iterator over dicts, example: {"record": "commit",
+            "sha": "4f1c...", "author": "John Doe", "email":
+            "john@example.com", "date": "2024-01-02T10:00:00+00:00",
+            "type": "feat", "scope": "api", "breaking": True, "section":
+            "features", "subject": "new api"}, ..., {"record":
+            "summary", "version": "2.0.0", "commits": 1, "bump_rules":
+            {"major": True, "minor": True, "patch": False}}
+        """
+        bump_rules: dict = {"major": False, "minor": False, "patch": False}
+        commits = 0
+        log_format = LOG_FIELD_SEPARATOR.join(["%H", "%an", "%ae", "%aI", "%s"])
+        for line in cls._cmd_stream(
+            f"git log --pretty=format:{log_format} "
+            f"{cls._changelog_range(start, end)}--no-merges"
+        ):
+            sha, author, email, date, commit = line.split(LOG_FIELD_SEPARATOR, 4)
+            commit = commit.rstrip()
+            if len(commit) == 0:
+                continue
+            section, record = cls._commit_parse(commit, commit_wo_prefix, sha=sha)
+            if record.breaking:
+                bump_rules["major"] = True
+            if SECTION_BUMP_RULES[section]:
+                bump_rules[SECTION_BUMP_RULES[section]] = True
+            commits += 1
+            yield {
+                "record": "commit",
+                "sha": sha,
+                "author": author,
+                "email": email,
+                "date": date,
+                "type": record.type,
+                "scope": record.scope,
+                "breaking": record.breaking,
+                "section": section,
+                "subject": record.subject,
+            }
+        yield {
+            "record": "summary",
+            "version": cls.bump_current_version(bump_rules) if end == "HEAD" else end,
+            "commits": commits,
+            "bump_rules": bump_rules,
+        }
 
     @classmethod
     def changelog_group(
@@ -224,6 +969,11 @@ class Git:
         end: str = "HEAD",
         commit_wo_prefix: bool = True,
         unique: bool = False,
+        notes: bool = False,
+        rebuild: bool = False,
+        jobs: int = 1,
+        max_entries: Optional[int] = None,
+        keep: str = "first",
     ) -> dict:
         """
         Get a raw change log from the 'start' to the 'end' steps.
@@ -232,19 +982,318 @@ class Git:
         :param end: to git tag of HEAD by default
         :param commit_wo_prefix: remove commit pygitver prefixes if True
         :param unique: do not show duplicates commit if True
+        :param notes: read the changelog of a release ('end' is not HEAD)
+            from git notes if it is stored there, otherwise compute and
+            store it
+        :param rebuild: recompute the changelog even if it is stored in
+            git notes
+        :param jobs: number of processes to classify commits of long
+            ranges
+        :param max_entries: keep only 'max_entries' entries per section
+            (None - all entries), exact numbers of entries are in
+            'totals'
+        :param keep: "first" (the newest) or "last" (the oldest)
+            entries of a capped section
         :return: dict{"return_code": code, "result": {"fix": [], "feat":
             [], "other": []}}
         """
+        notes = notes and end != "HEAD"
+        note_key: dict = {
+            "start": start,
+            "commit_wo_prefix": commit_wo_prefix,
+            "unique": unique,
+            "max_entries": max_entries,
+        }
+        if max_entries is not None:
+            note_key["keep"] = keep
+        if notes and not rebuild:
+            note = cls.changelog_note_read(end)
+            if note is not None and all(
+                note.get(key) == value for key, value in note_key.items()
+            ):
+                return note["changelog_group"]
+
         git_log = cls.changelog(start=start, end=end)
         git_log_sorted = cls._changelog_group_sort(
-            git_log, commit_wo_prefix, unique=unique
+            git_log,
+            commit_wo_prefix,
+            unique=unique,
+            jobs=jobs,
+            max_entries=max_entries,
+            keep=keep,
         )
         ver = (
             cls.bump_current_version(git_log_sorted["bump_rules"])
             if end == "HEAD"
             else end
         )
-        return {"version": ver, **git_log_sorted}
+        res = {"version": ver, **git_log_sorted}
+        if notes:
+            cls.changelog_note_write(end, res, **note_key)
+        return res
+
+    @staticmethod
+    def _read_log_subjects(buf, separator: bytes = b"\n") -> Iterator[str]:
+        """
+        Read commit subjects from a buffer with an exported git log, only a
+        subject at a time is copied from the buffer.
+
+        :param buf: bytes-like object (for example, a memory-mapped file)
+        :param separator: newline - a subject per line ('git log
+            --pretty=format:%s'), NUL - NUL-separated full messages ('git
+            log -z --pretty=format:%B' or 'git log --format=%B%x00'), the
+            first non-blank line is the subject
+        :return: iterator with commit subjects
+        """
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            end = buf.find(separator, pos)
+            if end == -1:
+                end = size
+            # leading blank lines are ignored like git does, '%B%x00'
+            # writes a newline after every NUL
+            while pos < end and buf[pos] in b"\r\n":
+                pos += 1
+            subject_end = buf.find(b"\n", pos, end)
+            if subject_end == -1:
+                subject_end = end
+            yield buf[pos:subject_end].decode("utf-8", "replace")
+            pos = end + 1
+
+    @classmethod
+    def changelog_group_from_log(
+        cls,
+        file_name: str,
+        current_version: str = "",
+        commit_wo_prefix: bool = True,
+        unique: bool = False,
+        log_format: str = "lines",
+        max_entries: Optional[int] = None,
+        keep: str = "first",
+    ) -> dict:
+        """
+        Get a raw change log from an exported git log file without a git
+        repository, the file is memory-mapped, so a log of any size is not
+        loaded into memory.
+
+        :param file_name: file with the exported git log
+        :param current_version: version to bump, the current git tag is
+            used if it is empty
+        :param commit_wo_prefix: remove commit pygitver prefixes if True
+        :param unique: do not show duplicates commit if True
+        :param log_format: "lines" - a commit subject per line, "nul" -
+            NUL-separated full commit messages
+        :param max_entries: keep only 'max_entries' entries per section
+        :param keep: "first" or "last" entries of a capped section
+        :return: dict with "version", "bump_rules" and "changelog" (the
+            same as 'changelog_group')
+        """
+        separator = b"\0" if log_format == "nul" else b"\n"
+        with open(file_name, "rb") as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                # an empty file can not be mapped
+                res = cls._changelog_group_sort_commits(
+                    [], commit_wo_prefix, unique, max_entries, keep
+                )
+            else:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    res = cls._changelog_group_sort_commits(
+                        cls._read_log_subjects(buf, separator),
+                        commit_wo_prefix,
+                        unique,
+                        max_entries,
+                        keep,
+                    )
+        version = (
+            cls.bump_version(current_version, res["bump_rules"])
+            if current_version
+            else cls.bump_current_version(res["bump_rules"])
+        )
+        return {"version": version, **res}
+
+    @classmethod
+    def release(
+        cls, jobs: int = 1, max_entries: Optional[int] = None, keep: str = "first"
+    ) -> dict:
+        """
+        Get the current version, the next version and the changelog of the
+        next release at once: the tags are resolved and the git log is read
+        a single time.
+
+        :param jobs: number of processes to classify commits of long
+            ranges
+        :param max_entries: keep only 'max_entries' entries per section
+        :param keep: "first" or "last" entries of a capped section
+        :return: dict {"curr_ver": "v1.0.0", "next_ver": "v1.1.0",
+            "changelog_group": {...}}, "changelog_group" is the same as
+            'changelog_group' with unique commits
+        """
+        curr_ver = cls.version_current()
+        start = "" if curr_ver == CURRENT_VERSION_DEFAULT else curr_ver
+        # the range is built from the resolved version, the tags are not
+        # resolved again
+        git_log_sorted = cls._changelog_group_sort(
+            cls._changelog_log(cls._changelog_range(start, "HEAD", curr_ver)),
+            commit_wo_prefix=True,
+            unique=True,
+            jobs=jobs,
+            max_entries=max_entries,
+            keep=keep,
+        )
+        next_ver = cls.bump_version(curr_ver, git_log_sorted["bump_rules"])
+        return {
+            "curr_ver": curr_ver,
+            "next_ver": next_ver,
+            "changelog_group": {"version": next_ver, **git_log_sorted},
+        }
+
+    @classmethod
+    def changelog_group_update(
+        cls, changelog_group: dict, start: str, end: str, curr_ver: str
+    ) -> Optional[dict]:
+        """
+        Update a changelog (with unique commits) by the commits from 'start' to
+        'end': only these commits are read and classified, they go first in
+        every section.
+
+        :param changelog_group: changelog of the commits up to 'start'
+        :param start: commit the changelog ends at
+        :param end: new commit
+        :param curr_ver: current version to bump
+        :return: dict with "version", "bump_rules" and "changelog" (the
+            same as 'changelog_group'), None if 'start' is not an
+            ancestor of 'end' (the history was rewritten), the changelog
+            is to be rebuilt then
+        """
+        try:
+            cls._cmd(f"git merge-base --is-ancestor {start} {end}")
+        except GitError:
+            return None
+        delta = cls._changelog_group_sort(
+            cls._cmd(f"git log --pretty=format:%s {start}..{end} --no-merges"),
+            commit_wo_prefix=True,
+            unique=True,
+        )
+        merged = cls._changelog_group_merge(delta, changelog_group, unique=True)
+        return {"version": cls.bump_version(curr_ver, merged["bump_rules"]), **merged}
+
+    @classmethod
+    def head(cls) -> str:
+        """
+        Get the HEAD commit.
+
+        :return: string with the commit hash
+        """
+        return cls._cmd("git rev-parse HEAD").strip()
+
+    @classmethod
+    def tags_state(cls) -> str:
+        """
+        Get the state of the git tags, it changes when a tag is added, moved or
+        removed.
+
+        :return: string with an "object:refname" line per tag
+        """
+        return cls._cmd("git for-each-ref --format=%(objectname):%(refname) refs/tags")
+
+    @classmethod
+    def git_dirs(cls) -> Tuple[str, str]:
+        """
+        Get the git directory and the common directory (they are different for
+        worktrees).
+
+        :return: tuple with absolute paths (git dir, common dir)
+        """
+        git_dir = cls._cmd("git rev-parse --absolute-git-dir").strip()
+        common_dir = cls._cmd("git rev-parse --git-common-dir").strip()
+        return git_dir, os.path.join(os.getcwd(), common_dir)
+
+    @classmethod
+    def changelog_note_read(cls, tag: str) -> Optional[dict]:
+        """
+        Read the changelog of a release stored in git notes
+        ('refs/notes/pygitver').
+
+        :param tag: release git tag
+        :return: dict with the stored changelog of the tag: {"start":
+            ..., "commit_wo_prefix": ..., "unique": ...,
+            "changelog_group": {...}}, None if there is no valid note
+            for the tag
+        """
+        note = cls._changelog_note_document(tag)["tags"].get(tag)
+        if not isinstance(note, dict) or "changelog_group" not in note:
+            return None
+        scopes = note.pop("scopes", {})
+        changelog = note["changelog_group"]["changelog"]
+        for section, entries in changelog.items():
+            changelog[section] = ChangelogSection(entries, scopes.get(section))
+        return note
+
+    @classmethod
+    def _changelog_note_document(cls, tag: str) -> dict:
+        """
+        Read the whole git note of the commit a tag points to.
+
+        :param tag: release git tag
+        :return: dict {"format": ..., "tags": {tag: changelog}}, without
+            tags if there is no valid note
+        """
+        try:
+            note = json.loads(
+                cls._cmd(f"git notes --ref={NOTES_REF} show {tag}^{{commit}}")
+            )
+        except (GitError, json.JSONDecodeError):
+            note = None
+        if isinstance(note, dict) and note.get("format") == NOTES_FORMAT:
+            if isinstance(note.get("tags"), dict):
+                return note
+        return {"format": NOTES_FORMAT, "tags": {}}
+
+    @classmethod
+    def changelog_note_write(
+        cls,
+        tag: str,
+        changelog_group: dict,
+        start: str = "",
+        commit_wo_prefix: bool = True,
+        unique: bool = False,
+        max_entries: Optional[int] = None,
+        keep: str = "first",
+    ) -> None:
+        """
+        Store the changelog of a release in git notes ('refs/notes/pygitver'),
+        the stored changelog of the tag is overwritten, changelogs of other
+        tags of the same commit are kept.
+
+        :param tag: release git tag
+        :param changelog_group: dictionary with changelog (result of the
+            function 'changelog_group')
+        :param start: from git tag the changelog was computed
+        :param commit_wo_prefix: the changelog was computed without
+            commit pygitver prefixes
+        :param unique: the changelog was computed without duplicates
+        :param max_entries: the changelog sections were capped
+        :param keep: entries kept in the capped sections
+        """
+        document = cls._changelog_note_document(tag)
+        document["tags"][tag] = {
+            "start": start,
+            "commit_wo_prefix": commit_wo_prefix,
+            "unique": unique,
+            "max_entries": max_entries,
+            "keep": keep,
+            "changelog_group": changelog_group,
+            "scopes": {
+                section: entries.entry_scopes
+                for section, entries in changelog_group["changelog"].items()
+                if isinstance(entries, ChangelogSection)
+            },
+        }
+        cls._cmd(
+            f"git notes --ref={NOTES_REF} add -f -F - {tag}^{{commit}}",
+            input_text=json.dumps(document),
+        )
 
     @staticmethod
     def changelog_generate(changelog_group: dict, template_name: str = "") -> str:
@@ -258,17 +1307,22 @@ class Git:
         :return: string with formatted changelog
         """
         if not template_name:
-            script_directory = pathlib.Path(__file__).parent.resolve()
-            template_name = os.getenv(
-                "PYGITVER_TEMPLATE_CHANGELOG",
-                f"{script_directory}/templates/changelog.tmpl",
-            )
+            template_name = os.getenv("PYGITVER_TEMPLATE_CHANGELOG", TEMPLATE_CHANGELOG)
+        context = {
+            "version": changelog_group["version"],
+            **changelog_group["changelog"],
+            "totals": changelog_group.get("totals", {}),
+        }
+        renderer = native_renderer(template_name)
+        if renderer is not None:
+            return renderer(context)
+
+        from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+
         try:
             env = Environment(loader=FileSystemLoader(os.path.dirname(template_name)))
             template = env.get_template(os.path.basename(template_name))
-            output = template.render(
-                {"version": changelog_group["version"], **changelog_group["changelog"]}
-            )
+            output = template.render(context)
         except TemplateNotFound:
             output = f"ERROR: Template '{template_name}' was not found."
         return output
@@ -295,13 +1349,19 @@ class Git:
         """
         if len(prefix) == 0:
             prefix = os.environ.get("PYGITVER_VERSION_PREFIX", "")
-        for _tag in cls.tags():
+
+        def _accept(_tag: str) -> bool:
             if len(prefix) > 0 and not _tag.startswith(prefix):
-                continue
+                return False
+            return cls.version_validate(_tag)
 
-            if cls.version_validate(_tag):
-                return _tag
-        return CURRENT_VERSION_DEFAULT
+        # a single refs reader per call: it reads the git configuration
+        refs = cls._refs()
+        return cls._cached(
+            ("versions", prefix),
+            lambda: next(cls._tags_reachable(_accept, refs), CURRENT_VERSION_DEFAULT),
+            refs,
+        )
 
     @staticmethod
     def version_validate(version: str) -> bool:
@@ -312,7 +1372,7 @@ class Git:
         :return: True if version has correct format (example:
             'prefix1.2.3'), otherwise False
         """
-        return bool(re.match(r"^[a-z\-_]*\d+\.\d+\.\d+(?:-[a-zA-Z\d.]+)?$", version))
+        return bool(RE_VERSION.match(version))
 
     @classmethod
     def bump_current_version(cls, bump_rules: dict) -> str:
@@ -0,0 +1,197 @@
+import json
+import re
+from typing import IO, Iterator, Tuple
+
+RE_NON_WHITESPACE = re.compile(rb"[^ \t\n\r]")
+RE_STRING = re.compile(rb'"([^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*)"')
+# a string which is not terminated in the buffer yet
+RE_STRING_PARTIAL = re.compile(rb'"[^"\\\x00-\x1f]*(?:\\.[^"\\\x00-\x1f]*)*\\?\Z')
+# a string without escapes followed by a comma in an array, most of the
+# changelog entries
+RE_ARRAY_STRING = re.compile(rb'"([^"\\\x00-\x1f]*)"[ \t\n\r]*,[ \t\n\r]*')
+RE_NUMBER = re.compile(rb"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?")
+RE_NUMBER_END = re.compile(rb"[^0-9.eE+\-]")
+JSON_LITERALS = {b"true": True, b"false": False, b"null": None}
+COLON, COMMA, QUOTE, MAP_START, MAP_END, ARRAY_START, ARRAY_END = b':,"{}[]'
+
+CHUNK_SIZE = 65536
+
+
+class JsonStreamReader:
+    """
+    Minimal pull parser of JSON files: it reads a binary file in chunks and
+    yields events, so a document of any size is parsed in bounded memory
+    (except a single string, it is decoded as a whole).
+
+    Events are tuples (event, value, offset): "start_map", "end_map",
+    "start_array", "end_array", "key" and "value" (scalars), offset is
+    the position of the token in the file, a reader started at the
+    offset of a container parses only the container.
+    """
+
+    def __init__(self, fp: IO[bytes], offset: int = 0, whole: bool = True) -> None:
+        """
+        :param fp: binary file object
+        :param offset: position in the file to parse from
+        :param whole: parse the whole file (trailing data is an error),
+            otherwise stop after the first value
+        """
+        fp.seek(offset)
+        self._fp = fp
+        self._buf = b""
+        self._pos = 0
+        self._offset = offset
+        self._eof = False
+        self._whole = whole
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(
+            msg, self._buf.decode("utf-8", "replace"), self._pos
+        )
+
+    def _read_more(self) -> bool:
+        """
+        Read the next chunk into the buffer, already parsed data is dropped.
+
+        :return: False at the end of the file
+        """
+        if self._eof:
+            return False
+        # read at least as much as buffered: a long token is rescanned
+        # a logarithmic number of times
+        chunk = self._fp.read(max(CHUNK_SIZE, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        pos = self._pos
+        self._offset += pos
+        self._buf = self._buf[pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> int:
+        """
+        Skip whitespace and get the next byte.
+
+        :return: the next byte, -1 at the end of the file
+        """
+        while True:
+            match = RE_NON_WHITESPACE.search(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.start()
+                return self._buf[self._pos]
+            self._pos = len(self._buf)
+            if not self._read_more():
+                return -1
+
+    def _string(self) -> str:
+        while True:
+            match = RE_STRING.match(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.end()
+                try:
+                    if b"\\" not in match.group(1):
+                        # no escapes, the string is just UTF-8
+                        return match.group(1).decode("utf-8")
+                    return json.loads(match.group())
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    raise self._error("Invalid string")
+            if not RE_STRING_PARTIAL.match(self._buf, self._pos):
+                raise self._error("Invalid string")
+            if not self._read_more():
+                raise self._error("Unterminated string")
+
+    def _scalar(self):
+        while True:
+            if RE_NUMBER_END.search(self._buf, self._pos) is None and self._read_more():
+                # a number may continue in the next chunk
+                continue
+            match = RE_NUMBER.match(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.end()
+                return json.loads(match.group())
+            pos = self._pos
+            for literal, value in JSON_LITERALS.items():
+                end = pos + len(literal)
+                rest = self._buf[pos:end]
+                if rest == literal:
+                    self._pos += len(literal)
+                    return value
+                if literal.startswith(rest) and self._read_more():
+                    break
+            else:
+                raise self._error("Expecting value")
+
+    def events(self) -> Iterator[Tuple[str, object, int]]:
+        """
+        Parse the file.
+
+        :return: iterator with events (event, value, offset)
+        """
+        stack: list = []
+        expect = "value"
+        while True:
+            char = self._peek()
+            offset = self._offset + self._pos
+            if expect == "done":
+                if char != -1 and self._whole:
+                    raise self._error("Extra data")
+                return
+            if char == -1:
+                raise self._error("Unexpected end of data")
+
+            if expect == "colon":
+                if char != COLON:
+                    raise self._error("Expecting ':' delimiter")
+                self._pos += 1
+                expect = "value"
+                continue
+            if expect == "comma_or_end":
+                self._pos += 1
+                if char == COMMA:
+                    expect = "key" if stack[-1] == "map" else "value"
+                    continue
+                if char != (MAP_END if stack[-1] == "map" else ARRAY_END):
+                    raise self._error("Expecting ',' delimiter")
+                yield f"end_{stack.pop()}", None, offset
+            elif expect in ("key", "key_or_end"):
+                if char == MAP_END and expect == "key_or_end":
+                    self._pos += 1
+                    stack.pop()
+                    yield "end_map", None, offset
+                elif char == QUOTE:
+                    yield "key", self._string(), offset
+                    expect = "colon"
+                    continue
+                else:
+                    raise self._error("Expecting property name enclosed in quotes")
+            elif char == ARRAY_END and expect == "value_or_end":
+                self._pos += 1
+                stack.pop()
+                yield "end_array", None, offset
+            elif char in (MAP_START, ARRAY_START):
+                self._pos += 1
+                stack.append("map" if char == MAP_START else "array")
+                yield f"start_{stack[-1]}", None, offset
+                expect = "key_or_end" if char == MAP_START else "value_or_end"
+                continue
+            elif char == QUOTE:
+                match = (
+                    RE_ARRAY_STRING.match(self._buf, self._pos)
+                    if stack and stack[-1] == "array"
+                    else None
+                )
+                if match is not None:
+                    # the string and the next comma at once
+                    self._pos = match.end()
+                    try:
+                        value = match.group(1).decode("utf-8")
+                    except UnicodeDecodeError:
+                        raise self._error("Invalid string")
+                    yield "value", value, offset
+                    expect = "value"
+                    continue
+                yield "value", self._string(), offset
+            else:
+                yield "value", self._scalar(), offset
+            expect = "comma_or_end" if stack else "done"
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+from typing import IO, Iterable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def json_dumps(obj) -> str:
+    """
+    Serialize an object to a compact single-line JSON string, 'orjson' is used
+    if it is installed.
+
+    :param obj: object to serialize
+    :return: string with JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def write_ndjson(records: Iterable[dict], fp: IO[str]) -> None:
+    """
+    Write records as newline-delimited JSON, every record is flushed as soon as
+    it is written so consumers can read the stream while it is produced.
+
+    :param records: iterable with records
+    :param fp: text file object to write to
+    """
+    for record in records:
+        fp.write(json_dumps(record) + "\n")
+        fp.flush()
+
+
+def write_atomic(file_name: str, content: str) -> None:
+    """
+    Write a file atomically: readers see either the old or the new content,
+    never a partially written file.
+
+    :param file_name: target file name
+    :param content: string with the new file content
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, tmp_name = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(file_name)}.", suffix=".tmp"
+    )
+    try:
+        mode = os.stat(file_name).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    try:
+        with os.fdopen(fd, "w") as fp:
+            os.fchmod(fp.fileno(), mode)
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_name, file_name)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
@@ -2,7 +2,55 @@ import argparse
 
 from pygitver.git import Git, GitError, CURRENT_VERSION_DEFAULT
 from pygitver.changelogs_mngr import ChangelogsMngr, ChangelogsMngrError
+from pygitver.output import write_atomic, write_ndjson
+from pygitver.watcher import ChangelogWatcher, ChangelogWatcherError
 import json
+import sys
+from typing import Optional
+
+
+def check_commit_message(commit: str) -> None:
+    if not Git.check_commit_message(commit):
+        print("ERROR: Commit does not fit Conventional Commits requirements")
+        print(
+            "More about Conventional Commits: "
+            "https://www.conventionalcommits.org/en/v1.0.0/"
+        )
+        exit(1)
+
+
+RELEASE_ARTIFACTS = ("curr-ver", "next-ver", "text", "json")
+
+
+def release(
+    emit: str, jobs: int = 1, max_entries: Optional[int] = None, keep: str = "first"
+) -> None:
+    outputs = []
+    for item in filter(None, emit.split(",")):
+        artifact, _, file_name = item.strip().partition("=")
+        if artifact not in RELEASE_ARTIFACTS:
+            print(f"ERROR: unknown release artifact '{artifact}'")
+            exit(1)
+        outputs.append((artifact, file_name))
+
+    res = Git.release(jobs=jobs, max_entries=max_entries, keep=keep)
+    for artifact, file_name in outputs:
+        if artifact == "curr-ver":
+            content = res["curr_ver"]
+        elif artifact == "next-ver":
+            content = res["next_ver"]
+        elif artifact == "text":
+            content = Git.changelog_generate(res["changelog_group"])
+        else:
+            content = json.dumps(res["changelog_group"])
+        if not file_name:
+            print(content)
+            continue
+        try:
+            write_atomic(file_name, content + "\n")
+        except OSError as err:
+            print(f"ERROR: {err}")
+            exit(1)
 
 
 def main():
@@ -41,6 +89,32 @@ def main():
         help="check if the git commit message is valid for Conventional Commits",
         required=False,
     )
+    parser.add_argument(
+        "-ccmf",
+        "--check-commit-message-file",
+        action="store",
+        help="check if the git commit message in the file (the commit-msg hook "
+        "argument) is valid for Conventional Commits, comments are ignored",
+        required=False,
+    )
+    parser.add_argument(
+        "-ccs",
+        "--check-commit-stdin",
+        nargs="?",
+        const="ndjson",
+        choices=["ndjson", "nul"],
+        help="check git commit messages from stdin (JSON strings or objects "
+        "with 'message' and 'id' per line, or NUL-separated), "
+        "print a verdict record per message",
+        required=False,
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not keep resolved tags and current versions in the git "
+        "directory between runs",
+        required=False,
+    )
 
     # Changelog
     subparsers = parser.add_subparsers(
@@ -62,19 +136,89 @@ def main():
         "--format",
         type=str,
         default="text",
-        help="Change log format (text, json), default=text",
+        help="Change log format (text, json, ndjson), default=text",
+    )
+    changelog.add_argument(
+        "-n",
+        "--notes",
+        action="store_true",
+        help="Read the release changelog from git notes (refs/notes/pygitver), "
+        "compute and store it there if it is missing",
+    )
+    changelog.add_argument(
+        "-r",
+        "--rebuild",
+        action="store_true",
+        help="Recompute the release changelog stored in git notes",
+    )
+    changelog.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to classify commits of long ranges, default=1",
+    )
+    changelog.add_argument(
+        "-l",
+        "--from-log",
+        type=str,
+        default="",
+        help="Exported git log file to read commits from instead of the git "
+        "repository, --start and --end are ignored",
+    )
+    changelog.add_argument(
+        "-lf",
+        "--log-format",
+        type=str,
+        default="lines",
+        choices=["lines", "nul"],
+        help="Format of the exported git log: 'lines' - a commit subject per line "
+        "(git log --pretty=format:%%s), 'nul' - NUL-separated full messages "
+        "(git log -z --pretty=format:%%B), default=lines",
+    )
+    changelog.add_argument(
+        "-cv",
+        "--current-version",
+        type=str,
+        default="",
+        help="Current version to bump with --from-log, default=last git tag",
+    )
+    changelog.add_argument(
+        "-m",
+        "--max-entries",
+        type=int,
+        default=None,
+        help="Keep only N entries per changelog section, the exact numbers of "
+        "entries are in 'totals', default=all entries",
+    )
+    changelog.add_argument(
+        "-k",
+        "--keep",
+        type=str,
+        default="first",
+        choices=["first", "last"],
+        help="Entries to keep with --max-entries: the first (newest) or the "
+        "last (oldest) ones, default=first",
     )
     # Changelog ^^^
 
     # Changelogs
     changelogs = subparsers.add_parser("changelogs")
-    changelogs.add_argument(
+    # the source is required unless partial changelogs are merged
+    changelogs_source = changelogs.add_mutually_exclusive_group()
+    changelogs_source.add_argument(
         "-d",
         "--dir",
         type=str,
-        required=True,
         help="Directory with microservices' changelog files",
     )
+    changelogs_source.add_argument(
+        "-n",
+        "--notes",
+        type=str,
+        nargs="+",
+        help="Microservices' release tags with changelogs stored in git notes",
+    )
     changelogs.add_argument(
         "-clsv",
         "--changelogs-version",
@@ -88,21 +232,162 @@ def main():
         "--format",
         type=str,
         default="text",
-        help="Change log format (text, json), default=text",
+        help="Change log format (text, json, partial), 'partial' is a JSON "
+        "aggregate to merge with other ones by 'changelogs merge', default=text",
     )
     changelogs.add_argument(
         "-t",
         "--template",
         type=str,
-        default="templates/changelog-common.tmpl",
-        help="Template for the CHANGELOG in Jinja2 format",
+        default="",
+        help="Template for the CHANGELOG in Jinja2 format, "
+        "default=built-in markdown layout",
+    )
+    changelogs.add_argument(
+        "-c",
+        "--cache",
+        type=str,
+        default="",
+        help="File to keep rendered microservices' changelogs between runs, "
+        "only changed ones are rendered again",
+    )
+    changelogs.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to render microservices' changelogs, default=1",
+    )
+    changelogs.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Parse microservices' changelog files as a stream and write "
+        "the TEXT changelog in bounded memory",
+    )
+    changelogs.add_argument(
+        "-p",
+        "--previous",
+        type=str,
+        default="",
+        help="Previous changelogs in JSON format, only microservices changed "
+        "since then are included",
+    )
+    changelogs_merge = changelogs.add_subparsers(
+        title="Merge partial changelogs",
+        help="Merge partial aggregates (--format partial) of microservices' "
+        "changelogs, the result is the same as one --dir with all the files",
+    ).add_parser("merge")
+    changelogs_merge.add_argument(
+        "partials",
+        type=str,
+        nargs="+",
+        help="Files with partial aggregates",
     )
     # Changelogs ^^^
 
+    # Release
+    release_parser = subparsers.add_parser("release")
+    release_parser.add_argument(
+        "-e",
+        "--emit",
+        type=str,
+        default="next-ver",
+        help="Comma-separated release artifacts computed in one run: curr-ver, "
+        "next-ver, text, json, an artifact is written to a file with "
+        "'artifact=FILE', otherwise it is printed, default=next-ver",
+    )
+    release_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes to classify commits of long ranges, default=1",
+    )
+    release_parser.add_argument(
+        "-m",
+        "--max-entries",
+        type=int,
+        default=None,
+        help="Keep only N entries per changelog section, the exact numbers of "
+        "entries are in 'totals', default=all entries",
+    )
+    release_parser.add_argument(
+        "-k",
+        "--keep",
+        type=str,
+        default="first",
+        choices=["first", "last"],
+        help="Entries to keep with --max-entries: the first (newest) or the "
+        "last (oldest) ones, default=first",
+    )
+    # Release ^^^
+
+    # Watch
+    watch = subparsers.add_parser("watch")
+    watch.add_argument(
+        "-ot",
+        "--output-text",
+        type=str,
+        default="",
+        help="File to keep the TEXT changelog in",
+    )
+    watch.add_argument(
+        "-oj",
+        "--output-json",
+        type=str,
+        default="",
+        help="File to keep the JSON changelog in",
+    )
+    watch.add_argument(
+        "-t",
+        "--template",
+        type=str,
+        default="",
+        help="Template for the CHANGELOG in Jinja2 format",
+    )
+    watch.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=2.0,
+        help="Polling interval in seconds, default=2.0",
+    )
+    watch.add_argument(
+        "-p",
+        "--poll",
+        action="store_true",
+        help="Poll the git refs instead of using inotify",
+    )
+    # Watch ^^^
+
     args = parser.parse_args()
+    Git.use_cache = not args.no_cache
+    if "max_entries" in args and args.max_entries is not None and args.max_entries < 1:
+        print("ERROR: --max-entries must be a positive number")
+        exit(1)
 
     try:
-        if args.tags:
+        if "interval" in args:
+            try:
+                watcher = ChangelogWatcher(
+                    output_text=args.output_text,
+                    output_json=args.output_json,
+                    template_name=args.template,
+                    interval=args.interval,
+                    use_inotify=not args.poll,
+                )
+                watcher.run()
+            except ChangelogWatcherError as err:
+                print(err)
+                exit(1)
+            except KeyboardInterrupt:
+                pass
+        elif "emit" in args:
+            release(
+                args.emit, jobs=args.jobs, max_entries=args.max_entries, keep=args.keep
+            )
+        elif args.tags:
             for tag in Git.tags():
                 print(tag)
         elif args.curr_ver:
@@ -113,25 +398,102 @@ def main():
                 curr_ver = ""
             changelog_group = Git.changelog_group(start=curr_ver)
             print(changelog_group["version"])
+        elif "dir" in args and args.stream:
+            if not args.dir or args.format != "text" or args.previous:
+                print(
+                    "ERROR: --stream supports only --dir, the text format, no --previous"
+                )
+                exit(1)
+            join_changelogs = ChangelogsMngr(changelogs_version=args.changelogs_version)
+            try:
+                join_changelogs.generate_stream(
+                    path=args.dir, fp=sys.stdout, template_name=args.template
+                )
+            except ChangelogsMngrError as err:
+                print(err)
+                exit(1)
+            print()
         elif "dir" in args:
+            if "partials" not in args and not args.dir and not args.notes:
+                changelogs.error("one of the arguments -d/--dir -n/--notes is required")
+            if args.format == "partial" and args.previous:
+                print("ERROR: --previous can not be used with the partial format")
+                exit(1)
             join_changelogs = ChangelogsMngr(changelogs_version=args.changelogs_version)
-            output = join_changelogs.read_files(path=args.dir, file_ext="json")
+            try:
+                if "partials" in args:
+                    output = join_changelogs.read_partials(args.partials)
+                elif args.notes:
+                    output = join_changelogs.read_notes(tags=args.notes)
+                else:
+                    output = join_changelogs.read_files(path=args.dir, file_ext="json")
+                if args.previous:
+                    output = join_changelogs.delta(
+                        ChangelogsMngr.read_previous(args.previous)
+                    )
+            except ChangelogsMngrError as err:
+                print(err)
+                exit(1)
             if args.format == "text":
                 try:
-                    print(join_changelogs.generate(template_name=args.template))
+                    print(
+                        join_changelogs.generate(
+                            template_name=args.template,
+                            cache_file=args.cache,
+                            jobs=args.jobs,
+                        )
+                    )
                 except ChangelogsMngrError as err:
                     print(err)
                     exit(1)
             elif args.format == "json":
                 print(json.dumps(output))
+            elif args.format == "partial":
+                print(json.dumps(join_changelogs.partial()))
             else:
                 print("ERROR: unknown output format")
                 exit(1)
+        elif "format" in args and args.from_log:
+            if args.format not in ("text", "json"):
+                print("ERROR: --from-log supports only the text and json formats")
+                exit(1)
+            if args.current_version and not Git.version_validate(args.current_version):
+                print(f"ERROR: Version '{args.current_version}' is not valid")
+                exit(1)
+            try:
+                changelog_group = Git.changelog_group_from_log(
+                    args.from_log,
+                    current_version=args.current_version,
+                    unique=True,
+                    log_format=args.log_format,
+                    max_entries=args.max_entries,
+                    keep=args.keep,
+                )
+            except OSError as err:
+                print(f"ERROR: {err}")
+                exit(1)
+            if args.format == "text":
+                print(Git.changelog_generate(changelog_group))
+            else:
+                print(json.dumps(changelog_group))
+        elif "format" in args and args.format == "ndjson":
+            write_ndjson(
+                Git.changelog_records(
+                    start=args.start if args.start else Git.version_current(),
+                    end=args.end,
+                ),
+                sys.stdout,
+            )
         elif "format" in args:
             changelog_group = Git.changelog_group(
                 start=args.start if args.start else Git.version_current(),
                 end=args.end,
                 unique=True,
+                notes=args.notes,
+                rebuild=args.rebuild,
+                jobs=args.jobs,
+                max_entries=args.max_entries,
+                keep=args.keep,
             )
             if args.format == "text":
                 print(Git.changelog_generate(changelog_group))
@@ -146,15 +508,24 @@ def main():
         print(git_error["result"])
         exit(git_error["return_code"])
 
-    if args.check_commit_message:
-        res = Git.check_commit_message(args.check_commit_message)
-        if not res:
-            print("ERROR: Commit does not fit Conventional Commits requirements")
-            print(
-                "More about Conventional Commits: "
-                "https://www.conventionalcommits.org/en/v1.0.0/"
-            )
+    if args.check_commit_stdin:
+        valid = True
+        for record in Git.check_commit_messages(
+            sys.stdin.buffer, input_format=args.check_commit_stdin
+        ):
+            write_ndjson([record], sys.stdout)
+            valid = valid and record["valid"]
+        exit(0 if valid else 1)
+
+    if args.check_commit_message_file:
+        try:
+            with open(args.check_commit_message_file) as fp:
+                check_commit_message(Git.commit_message_cleanup(fp.read()))
+        except OSError as err:
+            print(f"ERROR: {err}")
             exit(1)
+    if args.check_commit_message:
+        check_commit_message(args.check_commit_message)
     exit(0)
 
 
@@ -0,0 +1,404 @@
+import hashlib
+import os
+import re
+import zlib
+from typing import Callable, Optional
+
+
+class RefsReaderError(Exception):
+    pass
+
+
+RE_OBJECT_ID = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+RE_VERSION_DIGITS = re.compile(r"\d+")
+RE_VERSION_SEMVER = re.compile(r"^([^\d]*)(\d+)\.(\d+)\.(\d+)(-[^\d].*)?$")
+RE_VERSION_LEADING_ZERO = re.compile(r"(?<!\d)0\d")
+
+# bigger 'packed-refs' files (a few thousand tags) are left to git: its C
+# parser and version sort are faster than Python there, the reader only
+# saves the git process for smaller repositories
+PACKED_REFS_MAX_SIZE = 256 * 1024
+
+# parsed 'packed-refs' files: {path: (stat key, (refs, peeled refs, fully
+# peeled, tags))}
+_PACKED_REFS_CACHE: dict = {}
+
+
+def _version_sort_digits(match: re.Match) -> str:
+    digits = match.group().lstrip("0") or "0"
+    # the length goes first: a longer number is greater
+    return "0" + chr(0x100 + len(digits)) + digits
+
+
+def version_sort_key(tag: str) -> str:
+    """
+    Get a sort key which orders tags like 'git tag --sort=v:refname': runs of
+    digits are compared as numbers, other characters one by one.
+
+    :param tag: git tag
+    :return: string to use as a sort key
+    """
+    return RE_VERSION_DIGITS.sub(_version_sort_digits, tag)
+
+
+def version_sort(tags: list, reverse: bool = False) -> list:
+    """
+    Sort tags like 'git tag --sort=v:refname'.
+
+    If all tags look like 'prefix1.2.3' or 'prefix1.2.3-suffix', cheaper
+    integer keys are used: prefixes are ranked with the prefix terminated
+    by a digit (it is where the first number starts), so they compare
+    character by character as in 'version_sort_key'.
+
+    Numbers with leading zeros are not supported: git compares them in
+    its own way (e.g. 'v1.0.1' is after 'v1.0.09'), so 'RefsReaderError' is
+    raised for them and git sorts the tags. Other tags have distinct keys,
+    the order does not depend on the input order.
+
+    :param tags: list with tags
+    :param reverse: sort in reverse order
+    :return: sorted list with tags
+    """
+    if RE_VERSION_LEADING_ZERO.search("\n".join(tags)):
+        raise RefsReaderError("Numbers with leading zeros are not supported.")
+    versions = []
+    for tag in tags:
+        search_res = RE_VERSION_SEMVER.match(tag)
+        if search_res is None:
+            return sorted(tags, key=version_sort_key, reverse=reverse)
+        versions.append(search_res.groups())
+    prefixes = {
+        prefix: rank
+        for rank, prefix in enumerate(
+            sorted({version[0] for version in versions}, key=lambda x: x + "0")
+        )
+    }
+    keys: list = [
+        (((prefixes[prefix] << 32 | int(major)) << 32 | int(minor)) << 32) | int(patch)
+        for prefix, major, minor, patch, _ in versions
+    ]
+    if any(version[4] for version in versions):
+        keys = [
+            (key, version_sort_key(version[4]) if version[4] else "")
+            for key, version in zip(keys, versions)
+        ]
+    order = sorted(range(len(tags)), key=keys.__getitem__, reverse=reverse)
+    return [tags[pos] for pos in order]
+
+
+class RefsReader:
+    """
+    Read git refs (HEAD, tags) directly from the git directory without running
+    git.
+
+    It raises 'RefsReaderError' for anything it does not handle
+    (reftable, version sort configuration, unusual repository
+    discovery), the caller should use git in this case.
+    """
+
+    def __init__(self) -> None:
+        self._git_dir = self._find_git_dir()
+        self._common_dir = os.path.normpath(
+            os.environ.get("GIT_COMMON_DIR", "") or self._read_common_dir(self._git_dir)
+        )
+        config = self._read_file(os.path.join(self._common_dir, "config")) or ""
+        if "refstorage" in config.lower() or not os.path.isdir(
+            os.path.join(self._common_dir, "refs")
+        ):
+            raise RefsReaderError("Unsupported refs storage.")
+
+    @staticmethod
+    def _read_file(file_name: str) -> Optional[str]:
+        try:
+            with open(file_name, "r") as fp:
+                return fp.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    @classmethod
+    def _find_git_dir(cls) -> str:
+        """
+        Find the git directory like git does: 'GIT_DIR' or '.git' (a directory
+        or a 'gitdir:' file of worktrees and submodules) in the current
+        directory or its parents.
+
+        :return: string with the absolute path of the git directory
+        """
+        if os.environ.get("GIT_DIR"):
+            return os.path.abspath(os.environ["GIT_DIR"])
+        if os.environ.get("GIT_CEILING_DIRECTORIES") or os.environ.get(
+            "GIT_DISCOVERY_ACROSS_FILESYSTEM"
+        ):
+            raise RefsReaderError("Unsupported git directory discovery.")
+        path = os.getcwd()
+        while True:
+            dot_git = os.path.join(path, ".git")
+            if os.path.isdir(dot_git):
+                return dot_git
+            if os.path.isfile(dot_git):
+                content = (cls._read_file(dot_git) or "").strip()
+                if not content.startswith("gitdir: "):
+                    raise RefsReaderError(f"Invalid gitdir file '{dot_git}'.")
+                return os.path.normpath(
+                    os.path.join(path, content.removeprefix("gitdir: "))
+                )
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise RefsReaderError("Git directory was not found.")
+            path = parent
+
+    @classmethod
+    def _read_common_dir(cls, git_dir: str) -> str:
+        """
+        Get the common directory of a worktree, it keeps refs shared by all
+        worktrees.
+
+        :param git_dir: git directory
+        :return: string with the common directory
+        """
+        common_dir = cls._read_file(os.path.join(git_dir, "commondir"))
+        if common_dir is None:
+            return git_dir
+        return os.path.join(git_dir, common_dir.strip())
+
+    @property
+    def git_dir(self) -> str:
+        return self._git_dir
+
+    @property
+    def common_dir(self) -> str:
+        return self._common_dir
+
+    @property
+    def objects_dir(self) -> str:
+        return os.environ.get("GIT_OBJECT_DIRECTORY") or os.path.join(
+            self._common_dir, "objects"
+        )
+
+    def _packed_refs(self) -> tuple:
+        """
+        Get refs from the 'packed-refs' file, the parsed file is cached until
+        it is changed.
+
+        :return: tuple with dicts {refname: object id} of refs and of
+            peeled refs, True if all annotated tags are peeled, and list
+            of tag names
+        """
+        file_name = os.path.join(self._common_dir, "packed-refs")
+        try:
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            return {}, {}, True, []
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = _PACKED_REFS_CACHE.get(file_name)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        if stat.st_size > PACKED_REFS_MAX_SIZE:
+            raise RefsReaderError("Too big 'packed-refs' file.")
+
+        refs: dict = {}
+        peeled: dict = {}
+        fully_peeled = False
+        refname = ""
+        with open(file_name, "r") as fp:
+            lines = fp.read().split("\n")
+        for line in lines:
+            if not line:
+                continue
+            if line[0] == "^":
+                peeled[refname] = line[1:]
+            elif line[0] == "#":
+                fully_peeled = "fully-peeled" in line.split()
+            else:
+                object_id, refname = line.split(" ", 1)
+                refs[refname] = object_id
+        tags = [
+            refname[10:] for refname in refs.keys() if refname.startswith("refs/tags/")
+        ]
+        packed_refs = (refs, peeled, fully_peeled, tags)
+        _PACKED_REFS_CACHE[file_name] = (stat_key, packed_refs)
+        return packed_refs
+
+    def _packed_ref(self, refname: str) -> Optional[str]:
+        """
+        Get a single ref from the 'packed-refs' file, a big file is searched
+        for the line of the ref instead of being parsed.
+
+        :param refname: full ref name, example: "refs/heads/main"
+        :return: string with the object id, None if the ref does not
+            exist
+        """
+        try:
+            return self._packed_refs()[0].get(refname)
+        except RefsReaderError:
+            pass
+        data = self._read_file(os.path.join(self._common_dir, "packed-refs")) or ""
+        end = data.find(f" {refname}\n")
+        if end < 0:
+            return None
+        start = data.rfind("\n", 0, end) + 1
+        return data[start:end]
+
+    def resolve(self, refname: str, depth: int = 0) -> Optional[str]:
+        """
+        Resolve a ref to the object id.
+
+        :param refname: full ref name, example: "refs/tags/v1.0.0"
+        :param depth: depth of symbolic refs resolution
+        :return: string with the object id, None if the ref does not
+            exist
+        """
+        if depth > 5:
+            raise RefsReaderError(f"Too deep symbolic ref '{refname}'.")
+        base_dir = self._git_dir if refname == "HEAD" else self._common_dir
+        content = self._read_file(os.path.join(base_dir, refname))
+        if content is None or os.path.isdir(os.path.join(base_dir, refname)):
+            return self._packed_ref(refname)
+        content = content.strip()
+        if content.startswith("ref: "):
+            return self.resolve(content.removeprefix("ref: "), depth + 1)
+        if not RE_OBJECT_ID.match(content):
+            raise RefsReaderError(f"Invalid ref '{refname}'.")
+        return content
+
+    def head(self) -> Optional[str]:
+        """
+        Get the HEAD commit.
+
+        :return: string with the commit id, None on an unborn branch
+        """
+        return self.resolve("HEAD")
+
+    def tags(self) -> list:
+        """
+        Get all tags (loose and packed).
+
+        :return: list with tag names
+        """
+        tags = set(self._packed_refs()[3])
+        tags_dir = os.path.join(self._common_dir, "refs", "tags")
+        for root, _, files in os.walk(tags_dir):
+            for file_name in files:
+                if not file_name.endswith(".lock"):
+                    tags.add(
+                        os.path.relpath(
+                            os.path.join(root, file_name), tags_dir
+                        ).replace(os.sep, "/")
+                    )
+        return list(tags)
+
+    def tags_sorted(self, accept: Optional[Callable[[str], bool]] = None) -> list:
+        """
+        Get tags sorted in reverse version order (like 'git tag -l
+        --sort=-v:refname').
+
+        :param accept: filter for the tags, it is applied before sorting
+        :return: list with tag names
+        """
+        if self._version_sort_configured():
+            raise RefsReaderError("Custom version sort is configured.")
+        tags = self.tags() if accept is None else list(filter(accept, self.tags()))
+        return version_sort(tags, reverse=True)
+
+    def _config_files(self) -> tuple:
+        home = os.path.expanduser("~")
+        xdg_config = os.environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config")
+        return (
+            os.path.join(self._common_dir, "config"),
+            os.path.join(self._git_dir, "config.worktree"),
+            os.path.join(home, ".gitconfig"),
+            os.path.join(xdg_config, "git", "config"),
+            "/etc/gitconfig",
+        )
+
+    def _version_sort_configured(self) -> bool:
+        """
+        Check if git configuration may change the version sort order
+        ('versionsort.suffix') or include other configuration files.
+
+        :return: True if it may be configured
+        """
+        if any(key.startswith("GIT_CONFIG") for key in os.environ.keys()):
+            return True
+        for file_name in self._config_files():
+            config = (self._read_file(file_name) or "").lower()
+            if "versionsort" in config or "[include" in config:
+                return True
+        return False
+
+    def fingerprint(self) -> str:
+        """
+        Get a fingerprint of the refs state the tags and the current versions
+        depend on: the HEAD commit, stats of 'packed-refs', of the loose tags,
+        of the files which change the history ('shallow', 'info/grafts' and
+        the replace refs) and of the git configuration files (the version
+        sort order).
+
+        :return: string with the fingerprint, it changes when the tags,
+            HEAD or the reachable history are changed
+        """
+        items = [str(self.head())]
+        files = [
+            os.path.join(self._common_dir, "packed-refs"),
+            os.path.join(self._common_dir, "shallow"),
+            os.path.join(self._common_dir, "info", "grafts"),
+            *self._config_files(),
+        ]
+        for refs_dir in ("tags", "replace"):
+            for root, _, file_names in os.walk(
+                os.path.join(self._common_dir, "refs", refs_dir)
+            ):
+                files.append(root)
+                files.extend(os.path.join(root, file_name) for file_name in file_names)
+        for file_name in files:
+            try:
+                stat = os.stat(file_name)
+            except (FileNotFoundError, NotADirectoryError):
+                items.append(f"{file_name} -")
+                continue
+            items.append(f"{file_name} {stat.st_mtime_ns} {stat.st_size} {stat.st_ino}")
+        return hashlib.sha256("\n".join(items).encode("utf-8")).hexdigest()
+
+    def peeled(self, tag: str) -> Optional[str]:
+        """
+        Get the object a tag points to, annotated tags are peeled.
+
+        :param tag: tag name
+        :return: string with the object id, None if it is unknown (the
+            tag object is packed, git is required to read it)
+        """
+        refname = f"refs/tags/{tag}"
+        object_id = self.resolve(refname)
+        if object_id is None:
+            return None
+        packed_refs, packed_peeled, fully_peeled, _ = self._packed_refs()
+        if packed_refs.get(refname) == object_id:
+            if refname in packed_peeled:
+                return packed_peeled[refname]
+            if fully_peeled:
+                return object_id
+        return self._peel_loose_object(object_id)
+
+    def _peel_loose_object(self, object_id: str, depth: int = 0) -> Optional[str]:
+        """
+        Peel a loose tag object.
+
+        :param object_id: object id
+        :param depth: depth of tags of tags
+        :return: string with the peeled object id, None if it is unknown
+        """
+        file_name = os.path.join(self.objects_dir, object_id[:2], object_id[2:])
+        try:
+            with open(file_name, "rb") as fp:
+                # the object header and the first line of a tag object
+                data = zlib.decompressobj().decompress(fp.read(1024), 256)
+        except (FileNotFoundError, zlib.error):
+            return None
+        if not data.startswith(b"tag "):
+            return object_id
+        target = data.split(b"\0", 1)[1].split(b"\n", 1)[0]
+        if not target.startswith(b"object ") or depth > 5:
+            return None
+        return self._peel_loose_object(
+            target.removeprefix(b"object ").decode(), depth + 1
+        )
@@ -0,0 +1,179 @@
+import os
+import pathlib
+from typing import Callable, Iterator, Optional
+
+TEMPLATES_DIR = pathlib.Path(__file__).parent.resolve() / "templates"
+TEMPLATE_CHANGELOG = f"{TEMPLATES_DIR}/changelog.tmpl"
+TEMPLATE_CHANGELOG_COMMON = f"{TEMPLATES_DIR}/changelog-common.tmpl"
+
+# (section, title, separator after the section) in the order of the bundled
+# templates, separators are the blank lines between the template blocks
+CHANGELOG_SECTIONS = (
+    ("features", "Features", "\n\n\n"),
+    ("bugfixes", "Bug Fixes", "\n\n\n"),
+    ("deprecations", "Deprecations", "\n\n"),
+    ("docs", "Improved Documentation", "\n\n"),
+    ("others", "Trivial/Internal Changes", "\n\n"),
+)
+
+
+def _render_release_info(context: dict) -> str:
+    date = context.get("date")
+    maintainer = context.get("maintainer")
+    released = f":Released: {date}" if date else ""
+    maintained = f":Maintainer: {maintainer}" if maintainer else ""
+    return f"{released}\n{maintained}\n"
+
+
+def _render_sections(
+    changelog: dict, heading: Callable[[str], str], totals: Optional[dict] = None
+) -> Iterator[str]:
+    for section, title, separator in CHANGELOG_SECTIONS:
+        items = changelog.get(section)
+        if items:
+            yield f"\n{heading(title)}\n\n"
+            for item in items:
+                yield f"\n* {str(item).capitalize()}\n"
+            more = totals.get(section, 0) - len(items) if totals else 0
+            if more > 0:
+                # entries dropped from a capped section
+                yield f"\n* And {more:,} more\n"
+            yield "\n"
+        yield separator
+
+
+def render_changelog(context: dict) -> str:
+    """
+    Render a changelog in the layout of the bundled 'changelog.tmpl' (rst)
+    without Jinja2, the output is identical to the template one.
+
+    :param context: dictionary with "version", changelog sections and
+        "totals" of capped sections
+    :return: string with formatted changelog
+    """
+    parts = [
+        "##########\nChange Log\n##########\n\n",
+        f"Version {context.get('version', '')}\n=============\n\n",
+        _render_release_info(context),
+        "\n",
+    ]
+    parts.extend(
+        _render_sections(
+            context,
+            lambda title: f"{title}\n{'-' * len(title)}",
+            context.get("totals"),
+        )
+    )
+    # the template ends right after the last section
+    return "".join(parts[:-1])
+
+
+def render_changelogs_header(context: dict) -> str:
+    """
+    Render the head of a group of changelogs (everything before the services)
+    in the layout of the bundled 'changelog-common.tmpl'.
+
+    :param context: dictionary with "version"
+    :return: string with formatted head
+    """
+    return (
+        f"# Change Log\n\n## Version: {context.get('version', '')}\n\n"
+        f"{_render_release_info(context)}\n\n## Services\n\n"
+    )
+
+
+def iter_changelogs_service(service_name: str, service: dict) -> Iterator[str]:
+    """
+    Render a changelog of a single service piece by piece, sections may be any
+    sized iterables (for example, entries read from a file on demand).
+
+    :param service_name: name of the service
+    :param service: dictionary with "version", "changelog" and "totals"
+        of capped sections
+    :return: iterator with parts of the formatted service changelog
+    """
+    yield (
+        f"\n\n### {str(service_name).capitalize()}\n\n"
+        f"Version: {service.get('version', '')}\n\n"
+    )
+    yield from _render_sections(
+        service["changelog"], lambda t: f"#### {t}", service.get("totals")
+    )
+
+
+def render_changelogs_service(service_name: str, service: dict) -> str:
+    """
+    Render a changelog of a single service in the layout of the bundled
+    'changelog-common.tmpl', the document is the head followed by the services
+    fragments.
+
+    :param service_name: name of the service
+    :param service: dictionary with "version" and "changelog"
+    :return: string with formatted service changelog
+    """
+    return "".join(iter_changelogs_service(service_name, service))
+
+
+def render_changelogs_footer(context: dict) -> str:
+    """
+    Render the tail of a group of changelogs (everything after the services) in
+    the layout of the bundled 'changelog-common.tmpl': the index of services
+    unchanged since the previous release.
+
+    :param context: dictionary with "unchanged" {service name: version}
+    :return: string with formatted tail, empty without unchanged
+        services
+    """
+    unchanged = context.get("unchanged")
+    if not unchanged:
+        return ""
+    services = "".join(
+        f"\n* {str(key).capitalize()}: {value}\n" for key, value in unchanged.items()
+    )
+    return f"\n## Unchanged Services\n\n{services}\n"
+
+
+def render_changelogs(context: dict) -> str:
+    """
+    Render a group of changelogs in the layout of the bundled 'changelog-
+    common.tmpl' (markdown) without Jinja2, the output is identical to the
+    template one.
+
+    :param context: dictionary with "version" and "services"
+    :return: string with formatted changelogs
+    """
+    services = "".join(
+        render_changelogs_service(key, value)
+        for key, value in context.get("services", {}).items()
+    )
+    # the template trailing newline is dropped
+    return (
+        render_changelogs_header(context) + services + render_changelogs_footer(context)
+    )
+
+
+def native_renderer(template_name: str) -> Optional[Callable[[dict], str]]:
+    """
+    Get the built-in renderer of a bundled template.
+
+    :param template_name: file name of the template
+    :return: renderer function, None for custom templates (Jinja2 is
+        required)
+    """
+    renderers = {
+        TEMPLATE_CHANGELOG: render_changelog,
+        TEMPLATE_CHANGELOG_COMMON: render_changelogs,
+    }
+    renderer = renderers.get(template_name)
+    if renderer is None and os.path.basename(template_name) in (
+        "changelog.tmpl",
+        "changelog-common.tmpl",
+    ):
+        # the bundled template given by a relative or another path
+        try:
+            for bundled_name, bundled_renderer in renderers.items():
+                if os.path.samefile(template_name, bundled_name):
+                    return bundled_renderer
+        except OSError:
+            return None
+    return renderer
@@ -0,0 +1,218 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import time
+from typing import Optional
+
+from pygitver.git import Git, CURRENT_VERSION_DEFAULT
+from pygitver.output import write_atomic
+
+
+class ChangelogWatcherError(Exception):
+    pass
+
+
+class _Inotify:
+    """Minimal Linux inotify binding (ctypes, no extra dependencies)."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: str) -> None:
+        """
+        Watch a directory for the changes (already watched paths are ignored by
+        the kernel).
+
+        :param path: directory to watch
+        """
+        if self._inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait for any event on the watched directories.
+
+        :param timeout: timeout in seconds
+        :return: True if there were events, False on timeout
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        # git writes several files per update (lock files, logs, refs),
+        # let it finish and read all the pending events at once
+        time.sleep(0.1)
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class ChangelogWatcher:
+    def __init__(
+        self,
+        output_text: str = "",
+        output_json: str = "",
+        template_name: str = "",
+        interval: float = 2.0,
+        use_inotify: bool = True,
+    ) -> None:
+        if not output_text and not output_json:
+            raise ChangelogWatcherError(
+                "ERROR: At least one output file (text or json) is required."
+            )
+        self._output_text = output_text
+        self._output_json = output_json
+        self._template_name = template_name
+        self._interval = interval
+        self._use_inotify = use_inotify
+        self._head = ""
+        self._tags_state = ""
+        self._version_current = ""
+        self._changelog_group: dict = {}
+        self._git_dirs: list = []
+
+    @property
+    def changelog_group(self) -> dict:
+        return self._changelog_group
+
+    def _refs_dirs(self) -> list:
+        """
+        Get directories which git updates on a new commit or tag.
+
+        :return: list of directories (HEAD and packed-refs are in the
+            git dir, refs are in the common dir for worktrees)
+        """
+        if not self._git_dirs:
+            self._git_dirs = list(Git.git_dirs())
+        dirs = list(self._git_dirs)
+        common_dir = dirs[-1]
+        for refs_dir in ("refs/heads", "refs/tags"):
+            for root, _, _ in os.walk(os.path.join(common_dir, refs_dir)):
+                dirs.append(root)
+        return dirs
+
+    def _rebuild(self) -> None:
+        """Classify the whole range from the current version to HEAD."""
+        start = (
+            self._version_current
+            if self._version_current != CURRENT_VERSION_DEFAULT
+            else ""
+        )
+        self._changelog_group = Git.changelog_group(start=start, unique=True)
+
+    def _update(self, head: str) -> None:
+        """
+        Classify only commits between the previously seen HEAD and the new one
+        and merge them into the in-memory changelog.
+
+        :param head: new HEAD commit
+        """
+        changelog_group = Git.changelog_group_update(
+            self._changelog_group, self._head, head, self._version_current
+        )
+        if changelog_group is None:
+            # history was rewritten (reset, rebase), the delta is unknown
+            self._rebuild()
+            return
+        self._changelog_group = changelog_group
+
+    def _write(self) -> None:
+        if self._output_text:
+            write_atomic(
+                self._output_text,
+                Git.changelog_generate(
+                    self._changelog_group, template_name=self._template_name
+                ),
+            )
+        if self._output_json:
+            write_atomic(self._output_json, json.dumps(self._changelog_group))
+
+    def refresh(self) -> bool:
+        """
+        Check the repository refs and update the changelog if a new commit or
+        tag arrived.
+
+        :return: True if the changelog was updated and the output files
+            were rewritten
+        """
+        head = Git.head()
+        tags_state = Git.tags_state()
+        if head == self._head and tags_state == self._tags_state:
+            return False
+
+        version_current = (
+            Git.version_current()
+            if tags_state != self._tags_state
+            else self._version_current
+        )
+        if not self._head or version_current != self._version_current:
+            self._version_current = version_current
+            self._rebuild()
+        elif head != self._head:
+            self._update(head)
+        self._head = head
+        self._tags_state = tags_state
+        self._write()
+        return True
+
+    def run(self, max_updates: Optional[int] = None) -> None:
+        """
+        Watch the repository refs and keep the changelog up to date.
+
+        Linux inotify is used if available, otherwise (or if a directory
+        can not be watched) refs are polled every 'interval' seconds.
+
+        :param max_updates: stop after the number of updates, run
+            forever if None
+        """
+        inotify = None
+        if self._use_inotify:
+            try:
+                inotify = _Inotify()
+            except (OSError, AttributeError, TypeError):
+                inotify = None
+
+        updates = 0
+        try:
+            while True:
+                if self.refresh():
+                    print(self._changelog_group["version"], flush=True)
+                    updates += 1
+                    if max_updates is not None and updates >= max_updates:
+                        return
+                if inotify is not None:
+                    try:
+                        for path in self._refs_dirs():
+                            inotify.add_watch(path)
+                    except OSError:
+                        # the watches limit (ENOSPC) or a removed refs
+                        # directory (ENOENT), poll the refs
+                        inotify.close()
+                        inotify = None
+                if inotify is not None:
+                    inotify.wait(self._interval)
+                else:
+                    time.sleep(self._interval)
+        finally:
+            if inotify is not None:
+                inotify.close()
@@ -1,7 +1,10 @@
+import io
 import os
 import json
+import tempfile
 import unittest
 from unittest import mock
+from pygitver import changelogs_mngr
 from pygitver.changelogs_mngr import ChangelogsMngr, ChangelogsMngrError
 from pygitver.git import Git
 
@@ -68,3 +71,182 @@ class TestChangelogsMngr(unittest.TestCase):
             chl_mngr.generate(template_name=template_name)
         self.assertEqual(f"ERROR: Template '{template_name}' was not found.",
                          str(context.exception))
+
+    @mock.patch.object(Git, "changelog_note_read")
+    def test_join_changelogs_notes(self, monkeypatch):
+        notes = {}
+        for service in ("service-1", "service-2"):
+            with open(f"tests/data/changelogs/{service}.json", "r") as fp:
+                notes[f"{service}_{service[-1]}.0.0"] = {"changelog_group": json.load(fp)}
+        monkeypatch.side_effect = notes.get
+
+        res = ChangelogsMngr().read_notes(list(notes.keys()))
+        with open("tests/data/joined_changelog.json", "r") as fp:
+            expected = json.load(fp)
+        self.assertEqual(expected, res)
+
+        with self.assertRaises(ChangelogsMngrError) as context:
+            ChangelogsMngr().read_notes(["v3.0.0"])
+        self.assertEqual("ERROR: Changelog of 'v3.0.0' is not stored in git notes.",
+                         str(context.exception))
+
+    def test_service_name(self):
+        self.assertEqual("service_a", ChangelogsMngr._service_name("service_a_1.2.3"))
+        self.assertEqual("service-b", ChangelogsMngr._service_name("service-b-v1.2.3-rc1"))
+        self.assertEqual("v1.2.3", ChangelogsMngr._service_name("v1.2.3"))
+        self.assertEqual("1.2.3", ChangelogsMngr._service_name("1.2.3"))
+
+    def test_generate_fragments_cache(self):
+        template_name = "src/pygitver/templates/changelog-common.tmpl"
+        chl_mngr = ChangelogsMngr("2.1.2")
+        chl_mngr.read_files("./tests/data/changelogs/", "json")
+        expected = chl_mngr.generate(template_name=template_name)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_file = os.path.join(tmp_dir, "fragments.json")
+            with mock.patch.object(ChangelogsMngr, "_render_services",
+                                   side_effect=ChangelogsMngr._render_services) as render_services:
+                # all services are rendered on the first run
+                chl_mngr = ChangelogsMngr("2.1.2")
+                chl_mngr.read_files("./tests/data/changelogs/", "json")
+                self.assertEqual(expected, chl_mngr.generate(template_name=template_name, cache_file=cache_file))
+                self.assertEqual(2, len(render_services.call_args.args[0]))
+
+                # nothing is rendered on the next run with the same changelogs
+                render_services.reset_mock()
+                chl_mngr = ChangelogsMngr("2.1.2")
+                chl_mngr.read_files("./tests/data/changelogs/", "json")
+                self.assertEqual(expected, chl_mngr.generate(template_name=template_name, cache_file=cache_file))
+                self.assertEqual([], render_services.call_args.args[0])
+
+                # only the changed service is rendered
+                render_services.reset_mock()
+                chl_mngr._changelogs["services"]["service-2"]["version"] = "2.0.1"
+                res = chl_mngr.generate(template_name=template_name, cache_file=cache_file)
+                self.assertEqual(expected.replace("Version: 2.0.0", "Version: 2.0.1"), res)
+                self.assertEqual(["service-2"], [name for name, _ in render_services.call_args.args[0]])
+
+            with open(cache_file) as fp:
+                self.assertEqual(2, len(json.load(fp)["fragments"]))
+
+    @mock.patch.object(changelogs_mngr, "PARALLEL_RENDER_MIN_SERVICES", 2)
+    def test_generate_parallel(self):
+        chl_mngr = ChangelogsMngr("2.1.2")
+        chl_mngr.read_files("./tests/data/changelogs/", "json")
+        expected = chl_mngr.generate(template_name="src/pygitver/templates/changelog-common.tmpl", jobs=1)
+
+        chl_mngr = ChangelogsMngr("2.1.2")
+        chl_mngr.read_files("./tests/data/changelogs/", "json")
+        self.assertEqual(expected, chl_mngr.generate(jobs=2))
+
+    def test_generate_stream(self):
+        chl_mngr = ChangelogsMngr("2.1.2")
+        chl_mngr.read_files("./tests/data/changelogs/", "json")
+        expected = chl_mngr.generate()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for service_name in ("service-1", "service-2"):
+                with open(f"./tests/data/changelogs/{service_name}.json") as fp:
+                    service = json.load(fp)
+                # the order of keys and the formatting do not matter
+                with open(os.path.join(tmp_dir, f"{service_name}.json"), "w") as fp:
+                    json.dump(dict(reversed(service.items())), fp, indent=4)
+            with open(os.path.join(tmp_dir, "invalid.json"), "w") as fp:
+                fp.write('{"version": "1.0.0", "changelog": {"features": ["a",')
+
+            output = io.StringIO()
+            res = ChangelogsMngr("2.1.2").generate_stream(tmp_dir, output)
+        self.assertEqual(expected, output.getvalue())
+        self.assertEqual("3.0.0", res["version"])
+        self.assertEqual(["service-1", "service-2"], list(res["services"].keys()))
+
+        with self.assertRaises(ChangelogsMngrError):
+            ChangelogsMngr().generate_stream("./tests/data/changelogs/", output,
+                                             template_name="tests/custom.tmpl")
+
+    def test_delta(self):
+        previous = ChangelogsMngr("2.1.2").read_files("./tests/data/changelogs/", "json")
+        self.assertEqual("3.0.0", previous["version"])
+
+        # service-1 got a new release (patch), service-2 is unchanged
+        chl_mngr = ChangelogsMngr("2.1.2")
+        changelogs = chl_mngr.read_files("./tests/data/changelogs/", "json")
+        changelogs["services"]["service-1"] = {
+            "version": "1.2.1",
+            "bump_rules": {"major": False, "minor": False, "patch": True},
+            "changelog": {"features": [], "bugfixes": ["fix: test fix 3"], "deprecations": [], "others": [],
+                          "docs": [], "non_conventional_commit": []},
+        }
+        res = chl_mngr.delta(json.loads(json.dumps(previous)))
+        self.assertEqual("3.0.1", res["version"])
+        self.assertEqual(["service-1"], list(res["services"].keys()))
+        self.assertEqual({"service-2": "2.0.0"}, res["unchanged"])
+        self.assertEqual(["service-1", "service-2"], list(res["hashes"].keys()))
+        text = chl_mngr.generate()
+        self.assertIn("### Service-1\n\nVersion: 1.2.1", text)
+        self.assertNotIn("### Service-2", text)
+        self.assertTrue(text.endswith("## Unchanged Services\n\n\n* Service-2: 2.0.0\n\n"))
+
+        # the delta is the previous release of the next one: nothing changed
+        chl_mngr = ChangelogsMngr()
+        chl_mngr.read_files("./tests/data/changelogs/", "json")
+        chl_mngr._changelogs["services"]["service-1"] = changelogs["services"]["service-1"]
+        res = chl_mngr.delta(json.loads(json.dumps(res)))
+        self.assertEqual("3.0.1", res["version"])
+        self.assertEqual({}, res["services"])
+        self.assertEqual({"service-1": "1.2.1", "service-2": "2.0.0"}, res["unchanged"])
+
+    def test_read_previous(self):
+        with self.assertRaises(ChangelogsMngrError) as context:
+            ChangelogsMngr.read_previous("./tests/data/changelogs/broken-json.json")
+        self.assertEqual("ERROR: Previous changelogs './tests/data/changelogs/broken-json.json' are not valid.",
+                         str(context.exception))
+        self.assertEqual("1.0.0", ChangelogsMngr.read_previous("./tests/data/joined_changelog.json")["version"])
+
+    def test_merge_partials(self):
+        expected_mngr = ChangelogsMngr("2.1.2")
+        expected = expected_mngr.read_files("./tests/data/changelogs/", "json")
+
+        partials = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for service_name in ("service-2", "service-1"):
+                os.mkdir(os.path.join(tmp_dir, service_name))
+                with open(f"./tests/data/changelogs/{service_name}.json") as fp:
+                    service = fp.read()
+                with open(os.path.join(tmp_dir, service_name, f"{service_name}.json"), "w") as fp:
+                    fp.write(service)
+                chl_mngr = ChangelogsMngr()
+                chl_mngr.read_files(os.path.join(tmp_dir, service_name), "json")
+                partials.append(json.loads(json.dumps(chl_mngr.partial())))
+            empty = ChangelogsMngr().partial()
+
+            # any grouping and order of merges gives the same result
+            merged = ChangelogsMngr.merge_partials(partials)
+            self.assertEqual(merged, ChangelogsMngr.merge_partials(
+                [ChangelogsMngr.merge_partials([partials[1], empty]), ChangelogsMngr.merge_partials(partials[:1])]))
+            self.assertEqual(["service-1", "service-2"], list(merged["services"].keys()))
+            self.assertEqual({"major": True, "minor": True, "patch": True}, merged["bump_rules"])
+
+            file_names = []
+            for pos, partial in enumerate([merged, empty]):
+                file_names.append(os.path.join(tmp_dir, f"partial-{pos}.json"))
+                with open(file_names[-1], "w") as fp:
+                    json.dump(partial, fp)
+            chl_mngr = ChangelogsMngr("2.1.2")
+            self.assertEqual(expected, chl_mngr.read_partials(file_names))
+            self.assertEqual(expected_mngr.generate(), chl_mngr.generate())
+
+            with self.assertRaises(ChangelogsMngrError) as context:
+                ChangelogsMngr.merge_partials(partials + partials[:1])
+            self.assertEqual("ERROR: Service 'service-2' is in several partial changelogs.", str(context.exception))
+            with self.assertRaises(ChangelogsMngrError):
+                ChangelogsMngr().read_partials(["./tests/data/joined_changelog.json"])
+
+    def test_merge_partials_order(self):
+        # services are ordered by file names like 'read_files' does
+        partials = [
+            {"services": {name: {}}, "sort_keys": {name: f"{name}.json"}, "bump_rules": {}}
+            for name in ("a", "a-b")
+        ]
+        merged = ChangelogsMngr.merge_partials(partials)
+        self.assertEqual(["a-b", "a"], list(merged["services"].keys()))
@@ -1,5 +1,13 @@
+import io
+import json
 import os
-from pygitver.git import Git
+import pickle
+import pytest
+import subprocess
+import sys
+from jinja2 import Environment
+from pygitver import git
+from pygitver.git import ChangelogSection, Commit, Git, GitError
 from unittest import mock
 
 GIT_LOG_OUTPUT_MOCK = "fix: test fix 1\n" \
@@ -21,47 +29,55 @@ def test_tags():
     assert "v0.0.1" in Git.tags()
 
 
+def tags_sorted(*tags):
+    return lambda accept, refs: list(filter(accept, tags))
+
+
 def test_version_current(monkeypatch):
-    monkeypatch.setattr(Git, "tags", lambda: [])
+    monkeypatch.setattr(Git, "_tag_reachable", lambda *args: True)
+
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted())
     assert "v0.0.0" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["0.0.2", "0.0.1"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("0.0.2", "0.0.1"))
     assert "0.0.2" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["1.0.error"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("1.0.error"))
     assert "v0.0.0" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["1.0.error", "0.1.2"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("1.0.error", "0.1.2"))
     assert "0.1.2" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["R23.03-rc.1", "0.0.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("R23.03-rc.1", "0.0.1", "0.0.0"))
     assert "0.0.1" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["R23.08.10-rc.1", "0.0.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("R23.08.10-rc.1", "0.0.1", "0.0.0"))
     assert "0.0.1" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["v23.08.10-rc.1", "0.0.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("v23.08.10-rc.1", "0.0.1", "0.0.0"))
     assert "v23.08.10-rc.1" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["service23.08.10-rc.1", "0.0.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("service23.08.10-rc.1", "0.0.1", "0.0.0"))
     assert "service23.08.10-rc.1" == Git.version_current()
 
-    monkeypatch.setattr(Git, "tags", lambda: ["service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"))
     assert "service_a_0.1.1" == Git.version_current("service_a_")
 
-    monkeypatch.setattr(Git, "tags", lambda: ["service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"))
     assert "service_b_0.1.2" == Git.version_current("service_b_")
 
 
 @mock.patch.dict(os.environ, {"PYGITVER_VERSION_PREFIX": "service_b_"}, clear=True)
 def test_version_current_with_defined_prefix_b(monkeypatch):
-    monkeypatch.setattr(Git, "tags", lambda: ["service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tag_reachable", lambda *args: True)
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"))
     assert "service_b_0.1.2" == Git.version_current()
 
 
 @mock.patch.dict(os.environ, {"PYGITVER_VERSION_PREFIX": "service_a_"}, clear=True)
 def test_version_current_with_defined_prefix_a(monkeypatch):
-    monkeypatch.setattr(Git, "tags", lambda: ["service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"])
+    monkeypatch.setattr(Git, "_tag_reachable", lambda *args: True)
+    monkeypatch.setattr(Git, "_tags_sorted", tags_sorted("service_a_0.1.1", "service_b_0.1.2", "service_c_2.1.0", "3.2.1", "0.0.0"))
     assert "service_a_0.1.1" == Git.version_current()
 
 
@@ -215,6 +231,44 @@ def test_bump_current_version_auto(monkeypatch):
     assert "1.2.1" == ver
 
 
+def test_release(monkeypatch):
+    commands = []
+
+    def fake_cmd(command: str):
+        commands.append(command)
+        if command == "git log --pretty=format:%H --reverse -n 1":
+            return "firstsha"
+        if command.startswith("git log --pretty=format:%s "):
+            return GIT_LOG_OUTPUT_MOCK
+        raise AssertionError(command)
+
+    version_current = mock.Mock(return_value="1.2.3")
+    monkeypatch.setattr(Git, "_cmd", value=fake_cmd)
+    monkeypatch.setattr(Git, "version_current", version_current)
+
+    res = Git.release()
+    # the tags and the git log are read once
+    version_current.assert_called_once_with()
+    assert commands == ["git log --pretty=format:%s 1.2.3...HEAD --no-merges"]
+    assert res["curr_ver"] == "1.2.3"
+    assert res["next_ver"] == "2.0.0"
+    assert res["changelog_group"] == {
+        "version": "2.0.0",
+        **Git._changelog_group_sort(GIT_LOG_OUTPUT_MOCK, commit_wo_prefix=True, unique=True),
+    }
+
+    # no tags, the whole history
+    version_current.reset_mock()
+    commands.clear()
+    version_current.return_value = "v0.0.0"
+    assert Git.release()["next_ver"] == "v1.0.0"
+    version_current.assert_called_once_with()
+    assert commands == [
+        "git log --pretty=format:%H --reverse -n 1",
+        "git log --pretty=format:%s firstsha...HEAD --no-merges",
+    ]
+
+
 def test_version_prefix(monkeypatch):
     assert "" == Git._version_prefix("1.2.3")
     assert "v" == Git._version_prefix("v1.2.3")
@@ -275,6 +329,78 @@ def test_check_commit_message():
     assert Git.check_commit_message(" Merge pull request'test/test-rebase-2' into test/test-rebase-1") is False
 
 
+def test_commit_message_cleanup():
+    message = (
+        "# Please enter the commit message for your changes.\n"
+        "\n"
+        "feat(api): new api  \n"
+        "\n"
+        "\n"
+        "\n"
+        "Details #123\n"
+        "# On branch master\n"
+        "\n"
+        "# ------------------------ >8 ------------------------\n"
+        "diff --git a/file b/file\n"
+    )
+    assert Git.commit_message_cleanup(message) == "feat(api): new api\n\nDetails #123"
+    assert Git.commit_message_cleanup("; comment\nfix: a", comment_char=";") == "fix: a"
+    assert Git.commit_message_cleanup("# feat: commented out\n") == ""
+
+
+def git_log_nul(path, subjects: list) -> bytes:
+    """
+    Create a git repository with commits and export its log with 'git log
+    --format=%B%x00'.
+    """
+    subprocess.run(["git", "init", "-q", str(path)], check=True)
+    for subject in subjects:
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+             "commit", "-q", "--allow-empty", "-m", subject],
+            cwd=path,
+            check=True,
+        )
+    return subprocess.run(
+        ["git", "log", "--format=%B%x00"], cwd=path, check=True, stdout=subprocess.PIPE
+    ).stdout
+
+
+def test_check_commit_messages():
+    fp = io.BytesIO(
+        b'"feat: new api"\n'
+        b'{"id": "pr-1", "message": "non-conventional commit"}\n'
+        b"\n"
+        b'{"id": 2}\n'
+        b"not json\n"
+    )
+    assert list(Git.check_commit_messages(fp)) == [
+        {"index": 0, "valid": True},
+        {"index": 1, "id": "pr-1", "valid": False},
+        {"index": 2, "id": 2, "valid": False, "error": "Expecting a JSON string or an object with 'message'"},
+        {"index": 3, "valid": False, "error": "Expecting a JSON string or an object with 'message'"},
+    ]
+
+    fp = io.BytesIO(b"fix: test fix\n\nbody\0wip\0docs: update doc")
+    assert list(Git.check_commit_messages(fp, input_format="nul")) == [
+        {"index": 0, "valid": True},
+        {"index": 1, "valid": False},
+        {"index": 2, "valid": True},
+    ]
+
+
+def test_check_commit_messages_git_log(tmp_path):
+    # git writes a newline after every NUL
+    git_log = git_log_nul(tmp_path, ["wip stuff", "feat(x): five", "fix: two", "feat(x): five"])
+    assert git_log.startswith(b"feat(x): five\n\0\nfix: two")
+    assert list(Git.check_commit_messages(io.BytesIO(git_log), input_format="nul")) == [
+        {"index": 0, "valid": True},
+        {"index": 1, "valid": True},
+        {"index": 2, "valid": True},
+        {"index": 3, "valid": False},
+    ]
+
+
 def test_commit_msg_normalize():
     assert Git._commit_msg_normalize("fix: test ") == "test"
     assert Git._commit_msg_normalize("fix: test") == "test"
@@ -403,3 +529,371 @@ def test_changelog_without_current_version(monkeypatch):
     result = Git.changelog()
     assert "patch 1" in result
     assert "new feature" in result
+
+
+def test_changelog_group_merge():
+    newer = Git._changelog_group_sort(git_log="feat: new api\nfix: test fix 2\nfix: test fix 1",
+                                      commit_wo_prefix=True,
+                                      unique=True
+                                      )
+    older = Git._changelog_group_sort(git_log="fix: test fix 1\ndocs: update doc",
+                                      commit_wo_prefix=True,
+                                      unique=True
+                                      )
+    res = Git._changelog_group_merge(newer, older, unique=True)
+    assert res == Git._changelog_group_sort(git_log="feat: new api\nfix: test fix 2\nfix: test fix 1\n"
+                                                    "fix: test fix 1\ndocs: update doc",
+                                            commit_wo_prefix=True,
+                                            unique=True
+                                            )
+    assert res["bump_rules"] == {'major': False, 'minor': True, 'patch': True}
+
+    res = Git._changelog_group_merge(newer, older, unique=False)
+    assert res["changelog"]["bugfixes"] == ['test fix 2', 'test fix 1', 'test fix 1']
+
+
+@pytest.mark.parametrize("unique", [True, False])
+def test_changelog_group_sort_parallel(monkeypatch, unique):
+    git_log = "\n".join([GIT_LOG_OUTPUT_MOCK, "fix(db): test fix 3", GIT_LOG_OUTPUT_MOCK, "docs: update doc"] * 3)
+    expected = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique)
+
+    # the range is too short, the pool is not used
+    res = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique, jobs=2)
+    assert res == expected
+
+    monkeypatch.setattr(git, "PARALLEL_CLASSIFY_MIN_COMMITS", 2)
+    res = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique, jobs=2)
+    assert res == expected
+    for section, entries in res["changelog"].items():
+        assert entries.entry_scopes == expected["changelog"][section].entry_scopes
+
+
+@pytest.mark.parametrize("unique", [True, False])
+def test_changelog_group_from_log(monkeypatch, tmp_path, unique):
+    monkeypatch.setattr(Git, "_cmd", mock.Mock(side_effect=AssertionError("git is called")))
+    expected = Git._changelog_group_sort(GIT_LOG_OUTPUT_MOCK + "\nfix: test fix 1", commit_wo_prefix=True, unique=unique)
+
+    (tmp_path / "log").write_text(GIT_LOG_OUTPUT_MOCK + "\r\nfix: test fix 1\n")
+    res = Git.changelog_group_from_log(str(tmp_path / "log"), current_version="v1.2.3", unique=unique)
+    assert res == {"version": "v2.0.0", **expected}
+
+    # full messages: only subjects are classified
+    messages = [f"{subject}\n\nbody: breaking change: body\n" for subject in GIT_LOG_OUTPUT_MOCK.split("\n")]
+    (tmp_path / "log").write_bytes("\0".join(messages + ["fix: test fix 1"]).encode())
+    res = Git.changelog_group_from_log(
+        str(tmp_path / "log"), current_version="v1.2.3", unique=unique, log_format="nul"
+    )
+    assert res == {"version": "v2.0.0", **expected}
+
+    # 'git log --format=%B%x00' writes a newline after every NUL
+    subjects = GIT_LOG_OUTPUT_MOCK.split("\n") + ["fix: test fix 1"]
+    (tmp_path / "log").write_bytes(git_log_nul(tmp_path / "repo", subjects[::-1]))
+    res = Git.changelog_group_from_log(
+        str(tmp_path / "log"), current_version="v1.2.3", unique=unique, log_format="nul"
+    )
+    assert res == {"version": "v2.0.0", **expected}
+
+    (tmp_path / "log").write_bytes(b"")
+    res = Git.changelog_group_from_log(str(tmp_path / "log"), current_version="v1.2.3")
+    assert res["version"] == "v1.2.3"
+    assert not any(res["changelog"].values())
+
+
+@pytest.mark.parametrize("unique", [True, False])
+def test_changelog_group_sort_max_entries(unique):
+    git_log = "\n".join([GIT_LOG_OUTPUT_MOCK, "fix(db): test fix 3", GIT_LOG_OUTPUT_MOCK, "docs: update doc"])
+    expected = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique)
+    assert "totals" not in expected
+
+    res = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique, max_entries=2)
+    assert res["bump_rules"] == expected["bump_rules"]
+    assert res["totals"] == {section: len(entries) for section, entries in expected["changelog"].items()}
+    for section, entries in res["changelog"].items():
+        assert entries == expected["changelog"][section][:2]
+        assert entries.entry_scopes == expected["changelog"][section].entry_scopes[:2]
+
+    res = Git._changelog_group_sort(git_log, commit_wo_prefix=True, unique=unique, max_entries=2, keep="last", jobs=2)
+    assert res["totals"]["bugfixes"] == (3 if unique else 5)
+    for section, entries in res["changelog"].items():
+        assert entries == expected["changelog"][section][-2:]
+        assert entries.entry_scopes == expected["changelog"][section].entry_scopes[-2:]
+    assert pickle.loads(pickle.dumps(res["changelog"]["bugfixes"])).total == res["totals"]["bugfixes"]
+
+
+def test_changelog_section_keep_last():
+    section = ChangelogSection(max_entries=2, keep="last")
+    for pos in range(5):
+        section.add(f"fix {pos}", unique=True, scope="db" if pos % 2 else "")
+    assert section.add("fix 0", unique=True) is False
+    # the last entries are moved to the list at the end
+    assert section == []
+    section.finish()
+    assert section == ["fix 3", "fix 4"]
+    assert section.entry_scopes == ["db", ""]
+
+    section.add("fix 5", unique=True, scope="api")
+    section.finish()
+    assert section == ["fix 4", "fix 5"]
+    assert section.entry_scopes == ["", "api"]
+    assert section.total == 6
+
+    other = ChangelogSection(max_entries=2, keep="last")
+    other.add("fix 6", unique=False)
+    section.merge(other, unique=True)
+    section.finish()
+    assert section == ["fix 5", "fix 6"]
+
+
+def test_changelog_generate_max_entries(monkeypatch):
+    monkeypatch.setattr(Git, "changelog", value=lambda *args, **kwargs: "\n".join(f"fix: fix {i}" for i in range(1500)))
+    monkeypatch.setattr(Git, "version_current", value=lambda: "1.2.3")
+    changelog_group = Git.changelog_group(max_entries=1, keep="last")
+    assert changelog_group["changelog"]["bugfixes"] == ["fix 1499"]
+    assert "* Fix 1499\n\n* And 1,499 more\n" in Git.changelog_generate(changelog_group)
+
+
+def test_changelog_records(monkeypatch):
+    commands = []
+
+    def fake_cmd_stream(command: str):
+        commands.append(command)
+        for sha, commit in enumerate(GIT_LOG_OUTPUT_MOCK.split("\n")):
+            yield f"sha{sha}\x1fJohn Doe\x1fjohn@example.com\x1f2024-01-02T10:00:00+00:00\x1f{commit}"
+
+    monkeypatch.setattr(Git, "_cmd_stream", value=fake_cmd_stream)
+    monkeypatch.setattr(Git, "version_current", value=lambda: "1.2.3")
+
+    res = list(Git.changelog_records(start="1.2.3"))
+    assert commands == ["git log --pretty=format:%H\x1f%an\x1f%ae\x1f%aI\x1f%s 1.2.3...HEAD --no-merges"]
+    assert len(res) == 8
+    assert res[1] == {
+        "record": "commit",
+        "sha": "sha1",
+        "author": "John Doe",
+        "email": "john@example.com",
+        "date": "2024-01-02T10:00:00+00:00",
+        "type": "feat",
+        "scope": "api",
+        "breaking": True,
+        "section": "features",
+        "subject": "new api",
+    }
+    assert res[5]["type"] is None
+    assert res[5]["section"] == "non_conventional_commit"
+    assert res[0]["scope"] is None
+    assert res[0]["breaking"] is False
+    assert res[-1] == {
+        "record": "summary",
+        "version": "2.0.0",
+        "commits": 7,
+        "bump_rules": {"major": True, "minor": True, "patch": True},
+    }
+
+    # the same sections and the same order as the aggregated changelog
+    changelog = Git._changelog_group_sort(GIT_LOG_OUTPUT_MOCK, commit_wo_prefix=True, unique=False)["changelog"]
+    for section, commits in changelog.items():
+        assert commits == [record["subject"] for record in res[:-1] if record["section"] == section]
+
+
+def test_cmd_stream():
+    assert list(Git._cmd_stream("git --version"))[0].startswith("git version")
+
+
+def test_cmd_stream_stderr(tmp_path, monkeypatch):
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import sys\n"
+        "sys.stderr.write('warning\\n' * 100000)\n"
+        "sys.stderr.flush()\n"
+        "for pos in range(100000):\n"
+        "    print(pos)\n"
+        "sys.exit(int(sys.argv[1]))\n"
+    )
+    # more stderr than a pipe buffer does not block the process
+    assert len(list(Git._cmd_stream(f"{sys.executable} {script} 0"))) == 100000
+    with pytest.raises(GitError) as error:
+        list(Git._cmd_stream(f"{sys.executable} {script} 1"))
+    assert json.loads(str(error.value))["result"].startswith("warning\n")
+
+    # a consumer which stops early: the process is stopped and waited
+    processes = []
+    popen = subprocess.Popen
+
+    def fake_popen(*args, **kwargs):
+        processes.append(popen(*args, **kwargs))
+        return processes[-1]
+
+    monkeypatch.setattr(subprocess, "Popen", fake_popen)
+    stream = Git._cmd_stream(f"{sys.executable} {script} 0")
+    assert next(stream) == "0"
+    stream.close()
+    assert processes[0].returncode is not None
+
+
+def test_changelog_group_scopes():
+    res = Git._changelog_group_sort(git_log="feat(api)!: new api\n"
+                                            "fix(db): test fix 1\n"
+                                            "fix: test fix 2\n"
+                                            "fix(db): test fix 3\n"
+                                            "fix(api): test fix 1",
+                                    commit_wo_prefix=True,
+                                    unique=True
+                                    )
+    assert res["changelog"]["features"].scopes == {"api": ["new api"]}
+    assert res["changelog"]["bugfixes"] == ["test fix 1", "test fix 2", "test fix 3"]
+    assert res["changelog"]["bugfixes"].scopes == {"db": ["test fix 1", "test fix 3"], "": ["test fix 2"]}
+    assert json.loads(json.dumps(res))["changelog"]["bugfixes"] == ["test fix 1", "test fix 2", "test fix 3"]
+
+    section = pickle.loads(pickle.dumps(res["changelog"]["bugfixes"]))
+    assert section == res["changelog"]["bugfixes"]
+    assert section.scopes == res["changelog"]["bugfixes"].scopes
+    assert section.add("test fix 2", unique=True) is False
+
+    # the scopes column is not allocated for entries without scopes
+    section = ChangelogSection(["a", "b"])
+    assert section._scope_ids is None
+    assert section.entry_scopes == ["", ""]
+    section.add("c", unique=False, scope="api")
+    assert section.entry_scopes == ["", "", "api"]
+    assert section.scopes == {"": ["a", "b"], "api": ["c"]}
+    # the index is kept until the section is changed
+    assert section.scopes is section.scopes
+    section.add("d", unique=False)
+    assert section.scopes == {"": ["a", "b", "d"], "api": ["c"]}
+
+    template = Environment().from_string(
+        "{% for scope, items in bugfixes.scopes.items() %}{{ scope }}: {{ items | join(', ') }};{% endfor %}")
+    assert template.render(res["changelog"]) == "db: test fix 1, test fix 3;: test fix 2;"
+
+
+def test_commit_parse():
+    section, commit = Git._commit_parse("feat( api )!: new api", commit_wo_prefix=True, sha="abc")
+    assert section == "features"
+    assert commit == Commit(sha="abc", type="feat", scope="api", breaking=True, subject="new api")
+
+    section, commit = Git._commit_parse("some non-conventional commit", commit_wo_prefix=False)
+    assert section == "non_conventional_commit"
+    assert commit == Commit(sha="", type=None, scope=None, breaking=False, subject="some non-conventional commit")
+
+
+def test_changelog_group_notes(monkeypatch):
+    # notes are attached to commits: {commit: note}
+    notes = {}
+    commits = {"app_a_1.1.0": "c1", "app_b_1.0.1": "c1"}
+    changelog_calls = []
+
+    def commit_of(name: str) -> str:
+        # notes are written and read on the commit of a tag
+        assert name.endswith("^{commit}")
+        tag = name.removesuffix("^{commit}")
+        return commits.get(tag, tag)
+
+    def fake_cmd(command: str, input_text=None):
+        args = command.split(" ")
+        if args[:4] == ["git", "notes", "--ref=refs/notes/pygitver", "show"]:
+            commit = commit_of(args[4])
+            if commit not in notes:
+                raise GitError(json.dumps({"return_code": 1, "result": "error: no note found"}))
+            return notes[commit]
+        if args[:6] == ["git", "notes", "--ref=refs/notes/pygitver", "add", "-f", "-F"]:
+            notes[commit_of(args[7])] = input_text
+            return ""
+        raise AssertionError(command)
+
+    def fake_changelog(*args, **kwargs):
+        changelog_calls.append(kwargs)
+        return "feat(api): new api\nfix: test fix 1"
+
+    monkeypatch.setattr(Git, "_cmd", value=fake_cmd)
+    monkeypatch.setattr(Git, "changelog", value=fake_changelog)
+
+    # HEAD is not a release, nothing is stored
+    monkeypatch.setattr(Git, "version_current", value=lambda: "1.2.3")
+    Git.changelog_group(start="1.2.3", notes=True)
+    assert notes == {}
+
+    expected = Git.changelog_group(start="1.2.3", end="1.3.0", unique=True)
+    res = Git.changelog_group(start="1.2.3", end="1.3.0", unique=True, notes=True)
+    assert res == expected
+    assert list(notes.keys()) == ["1.3.0"]
+    assert len(changelog_calls) == 3
+
+    # stored note is used instead of walking the history
+    res = Git.changelog_group(start="1.2.3", end="1.3.0", unique=True, notes=True)
+    assert res == expected
+    assert res["changelog"]["features"].scopes == {"api": ["new api"]}
+    assert len(changelog_calls) == 3
+
+    # the note does not match the requested range or it is rebuilt
+    Git.changelog_group(start="1.2.0", end="1.3.0", unique=True, notes=True)
+    assert len(changelog_calls) == 4
+    Git.changelog_group(start="1.2.0", end="1.3.0", unique=True, notes=True, rebuild=True)
+    assert len(changelog_calls) == 5
+    assert json.loads(notes["1.3.0"])["tags"]["1.3.0"]["start"] == "1.2.0"
+
+    notes["1.4.0"] = "not a json"
+    assert Git.changelog_note_read("1.4.0") is None
+    assert Git.changelog_note_read("1.5.0") is None
+    notes["1.4.0"] = json.dumps({"format": "pygitver-changelog/1", "changelog_group": expected})
+    assert Git.changelog_note_read("1.4.0") is None
+
+    # releases of several services on the same commit keep their own changelogs
+    res_a = Git.changelog_group(start="app_a_1.0.0", end="app_a_1.1.0", unique=True, notes=True)
+    res_b = Git.changelog_group(start="app_b_1.0.0", end="app_b_1.0.1", unique=True, notes=True)
+    assert res_a["version"] == "app_a_1.1.0"
+    assert list(json.loads(notes["c1"])["tags"].keys()) == ["app_a_1.1.0", "app_b_1.0.1"]
+    assert Git.changelog_note_read("app_a_1.1.0")["changelog_group"]["version"] == "app_a_1.1.0"
+    assert Git.changelog_note_read("app_b_1.0.1")["changelog_group"] == res_b
+    assert Git.changelog_note_read("app_b_1.0.1")["start"] == "app_b_1.0.0"
+
+
+def test_tags_reachable(monkeypatch):
+    commands = []
+    reachable = ("v1.1.0", "v0.2.0", "v0.1.0")
+
+    def fake_cmd(command: str):
+        commands.append(command)
+        if command == "git tag -l --sort=-v:refname":
+            return "v2.0.0\nv1.2.0\nv1.1.0\nbad-tag\nv1.0.0\nv0.3.0\nv0.2.0\nv0.1.0\n"
+        if command == "git tag -l --sort=-v:refname --merged HEAD":
+            return "\n".join(reachable) + "\n"
+        if command.startswith("git merge-base --is-ancestor "):
+            if command.split(" ")[3] not in reachable:
+                raise GitError(json.dumps({"return_code": 1, "result": ""}))
+            return ""
+        raise AssertionError(command)
+
+    monkeypatch.setattr(Git, "_cmd", value=fake_cmd)
+    monkeypatch.setattr(Git, "_refs", lambda: None)
+
+    # the newest candidate is reachable: a single check
+    assert Git.version_current("v1.1") == "v1.1.0"
+    assert commands == [
+        "git tag -l --sort=-v:refname",
+        "git merge-base --is-ancestor v1.1.0 HEAD",
+    ]
+
+    # a newer tag of a release branch: checked one by one
+    commands.clear()
+    assert Git.version_current("v1.") == "v1.1.0"
+    assert commands == [
+        "git tag -l --sort=-v:refname",
+        "git merge-base --is-ancestor v1.2.0 HEAD",
+        "git merge-base --is-ancestor v1.1.0 HEAD",
+    ]
+
+    # more newer tags of other branches: the rest is checked at once
+    commands.clear()
+    assert Git.version_current() == "v1.1.0"
+    assert commands == [
+        "git tag -l --sort=-v:refname",
+        "git merge-base --is-ancestor v2.0.0 HEAD",
+        "git merge-base --is-ancestor v1.2.0 HEAD",
+        "git tag -l --sort=-v:refname --merged HEAD",
+    ]
+    commands.clear()
+    assert list(Git.tags_reachable(lambda tag: tag != "v1.1.0")) == ["v0.2.0", "v0.1.0"]
+    assert len(commands) == 4
+
+    # detached HEAD: no branch is required
+    assert Git.tags() == ["v1.1.0", "v0.2.0", "v0.1.0"]
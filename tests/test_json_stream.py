@@ -0,0 +1,76 @@
+import io
+import json
+
+import pytest
+
+from pygitver import json_stream
+from pygitver.json_stream import JsonStreamReader
+
+DOCUMENTS = [
+    {"a": [1, 2.5, -3e10, True, False, None, 'x"y\\u00e9é', {"b": []}], "c": {}},
+    {"version": "1.0.0", "changelog": {"features": ["a", "b", "c"], "docs": []}},
+    ["😀 \n", "é" * 1000, 12345678901234567890, 0, -0.5e-3],
+    [],
+    "string",
+]
+
+
+def load(events) -> object:
+    """Build an object from parser events."""
+    stack: list = []
+    keys: list = []
+    root: list = []
+    for event, value, _ in events:
+        if event == "key":
+            keys[-1] = value
+            continue
+        if event.startswith("end_"):
+            stack.pop()
+            keys.pop()
+            continue
+        if event.startswith("start_"):
+            value = {} if event == "start_map" else []
+        if not stack:
+            root.append(value)
+        elif isinstance(stack[-1], dict):
+            stack[-1][keys[-1]] = value
+        else:
+            stack[-1].append(value)
+        if event.startswith("start_"):
+            stack.append(value)
+            keys.append(None)
+    return root[0]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 65536])
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("indent", [None, 2])
+def test_events(monkeypatch, chunk_size, document, indent):
+    monkeypatch.setattr(json_stream, "CHUNK_SIZE", chunk_size)
+    for ensure_ascii in (True, False):
+        data = json.dumps(document, indent=indent, ensure_ascii=ensure_ascii).encode()
+        assert load(JsonStreamReader(io.BytesIO(data)).events()) == document
+
+
+@pytest.mark.parametrize("chunk_size", [1, 65536])
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"[", b'{"a":1,}', b'["a",]', b"[1 2]", b'{"a" 1}', b"{1:2}", b"[1]x",
+     b'"abc', b"[tru]", b"[01]", b"[1.]", b'["\x01"]', b'["\xff", 1]', b'["\\x"]'],
+)
+def test_events_invalid(monkeypatch, chunk_size, data):
+    monkeypatch.setattr(json_stream, "CHUNK_SIZE", chunk_size)
+    with pytest.raises(json.JSONDecodeError):
+        list(JsonStreamReader(io.BytesIO(data)).events())
+
+
+def test_events_offset(monkeypatch):
+    monkeypatch.setattr(json_stream, "CHUNK_SIZE", 4)
+    data = b'{"x": [1, {"y": "z"}], "w": 3}'
+    offsets = {event: offset for event, _, offset in JsonStreamReader(io.BytesIO(data)).events()}
+    assert offsets["start_array"] == data.index(b"[")
+
+    # only the array is parsed from its offset
+    events = list(JsonStreamReader(io.BytesIO(data), offsets["start_array"], whole=False).events())
+    assert load(events) == [1, {"y": "z"}]
+    assert events[-1] == ("end_array", None, data.index(b"]"))
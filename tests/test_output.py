@@ -0,0 +1,55 @@
+import io
+import json
+import os
+
+import pytest
+
+from pygitver import output
+from pygitver.output import json_dumps, write_atomic, write_ndjson
+
+
+def test_write_atomic(tmp_path):
+    file_name = str(tmp_path / "test.txt")
+    write_atomic(file_name, "test 1")
+    os.chmod(file_name, 0o600)
+    write_atomic(file_name, "test 2")
+    with open(file_name) as fp:
+        assert fp.read() == "test 2"
+    assert os.stat(file_name).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["test.txt"]
+
+
+def test_write_atomic_error(tmp_path, monkeypatch):
+    file_name = str(tmp_path / "test.txt")
+    write_atomic(file_name, "test 1")
+
+    def fchmod(fd, mode):
+        fds.append(fd)
+        raise PermissionError(fd)
+
+    fds: list = []
+    monkeypatch.setattr(os, "fchmod", fchmod)
+    with pytest.raises(PermissionError):
+        write_atomic(file_name, "test 2")
+    # the temporary file is closed and removed, the target is kept
+    with pytest.raises(OSError):
+        os.fstat(fds[0])
+    assert os.listdir(tmp_path) == ["test.txt"]
+    with open(file_name) as fp:
+        assert fp.read() == "test 1"
+
+
+def test_json_dumps(monkeypatch):
+    record = {"sha": "abc", "scope": None, "breaking": True, "subject": "new api ✓"}
+    res = json_dumps(record)
+    assert "\n" not in res
+    assert json.loads(res) == record
+
+    monkeypatch.setattr(output, "orjson", None)
+    assert json_dumps(record) == '{"sha":"abc","scope":null,"breaking":true,"subject":"new api ✓"}'
+
+
+def test_write_ndjson():
+    fp = io.StringIO()
+    write_ndjson(iter([{"record": "commit"}, {"record": "summary"}]), fp)
+    assert fp.getvalue() == '{"record":"commit"}\n{"record":"summary"}\n'
@@ -0,0 +1,251 @@
+import os
+import subprocess
+
+import pytest
+
+from pygitver import refs
+from pygitver.git import Git
+from pygitver.refs import RefsReader, RefsReaderError, version_sort, version_sort_key
+
+TAGS = [
+    "v1.0.0",
+    "v1.0.0-rc1",
+    "v1.2.0",
+    "v1.10.0",
+    "v2.0.0",
+    "v0.9.9",
+    "service_a_0.1.1",
+    "service_b_0.1.2",
+    "R23.3-rc.1",
+    "v10.0.0",
+    "release/v3.0.0",
+]
+
+
+def git(*args, cwd):
+    return (
+        subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE)
+        .stdout.decode()
+        .strip()
+    )
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    for key in list(os.environ.keys()):
+        if key.startswith("GIT_"):
+            monkeypatch.delenv(key)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / ".config"))
+    path = tmp_path / "repo"
+    path.mkdir()
+    git("init", "-q", cwd=path)
+    git(
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "-q",
+        "--allow-empty",
+        "-m",
+        "init",
+        cwd=path,
+    )
+    for pos, tag in enumerate(TAGS):
+        if pos % 2:
+            git(
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@example.com",
+                "tag",
+                "-a",
+                "-m",
+                tag,
+                tag,
+                cwd=path,
+            )
+        else:
+            git("tag", tag, cwd=path)
+    monkeypatch.chdir(path)
+    return path
+
+
+def test_version_sort_key():
+    assert sorted(TAGS, key=version_sort_key) == [
+        "R23.3-rc.1",
+        "release/v3.0.0",
+        "service_a_0.1.1",
+        "service_b_0.1.2",
+        "v0.9.9",
+        "v1.0.0",
+        "v1.0.0-rc1",
+        "v1.2.0",
+        "v1.10.0",
+        "v2.0.0",
+        "v10.0.0",
+    ]
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_refs_reader(repo, packed):
+    if packed:
+        git("pack-refs", "--all", cwd=repo)
+    git("tag", "v1.3.0", cwd=repo)
+
+    refs = RefsReader()
+    assert refs.tags_sorted() == git("tag", "-l", "--sort=-v:refname", cwd=repo).split(
+        "\n"
+    )
+    head = git("rev-parse", "HEAD", cwd=repo)
+    assert refs.head() == head
+    for tag in TAGS:
+        assert refs.peeled(tag) == head
+    assert refs.peeled("no-tag") is None
+
+    # detached HEAD
+    git("checkout", "-q", "--detach", cwd=repo)
+    assert RefsReader().head() == head
+
+
+def test_refs_reader_worktree(repo, tmp_path):
+    git(
+        "worktree",
+        "add",
+        "-q",
+        "--detach",
+        str(tmp_path / "worktree"),
+        "v1.0.0",
+        cwd=repo,
+    )
+    os.chdir(tmp_path / "worktree")
+    refs = RefsReader()
+    assert refs.common_dir == str(repo / ".git")
+    assert refs.head() == git("rev-parse", "HEAD", cwd=repo)
+    assert "v2.0.0" in refs.tags()
+
+
+def test_refs_reader_git_dir(repo, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(RefsReaderError):
+        RefsReader()
+    monkeypatch.setenv("GIT_DIR", str(repo / ".git"))
+    assert RefsReader().head() == git("rev-parse", "HEAD", cwd=repo)
+
+
+def test_refs_reader_fallback(repo, monkeypatch):
+    git("config", "versionsort.suffix", "-rc", cwd=repo)
+    with pytest.raises(RefsReaderError):
+        RefsReader().tags_sorted()
+
+    # git is used if the reader can not sort tags
+    tags = list(Git._tags_sorted(lambda tag: True, Git._refs()))
+    assert tags == git("tag", "-l", "--sort=-v:refname", cwd=repo).split("\n")
+    assert tags[-1] == "R23.3-rc.1"
+
+
+def test_version_sort_leading_zeros(repo):
+    tags = ["v1.0.0", "v1.0.1", "v1.0.09", "v1.00.5"]
+    with pytest.raises(RefsReaderError):
+        version_sort(tags)
+    assert version_sort(list(reversed(tags[:2]))) == tags[:2]
+
+    # git sorts numbers with leading zeros ('v1.0.0' is tagged by the fixture)
+    for tag in tags[1:]:
+        git("tag", tag, cwd=repo)
+    result = list(Git._tags_sorted(lambda tag: tag in tags, Git._refs()))
+    assert result[0] == "v1.0.1"
+    assert result == [
+        tag for tag in git("tag", "-l", "--sort=-v:refname", cwd=repo).split("\n") if tag in tags
+    ]
+
+
+def test_refs_reader_packed_refs_limit(repo, monkeypatch):
+    git("pack-refs", "--all", cwd=repo)
+    monkeypatch.setattr(refs, "PACKED_REFS_MAX_SIZE", 0)
+    with pytest.raises(RefsReaderError):
+        RefsReader().tags()
+    # single refs are found without parsing the file
+    assert RefsReader().head() == git("rev-parse", "HEAD", cwd=repo)
+
+    # git reads big 'packed-refs' files
+    assert Git.version_current() == "v10.0.0"
+
+
+def test_version_current_without_git(repo, monkeypatch):
+    def fake_cmd(command: str):
+        raise AssertionError(command)
+
+    monkeypatch.setattr(Git, "_cmd", value=fake_cmd)
+    assert Git.version_current() == "v10.0.0"
+    assert Git.version_current("service_b_") == "service_b_0.1.2"
+
+
+def test_version_cache(repo, monkeypatch):
+    monkeypatch.setattr(Git, "use_cache", True)
+    assert Git.version_current() == "v10.0.0"
+    assert Git.tags()[0] == "v10.0.0"
+    assert (repo / ".git" / "pygitver-cache.json").is_file()
+
+    def fake_tags(*args):
+        raise AssertionError("tags are resolved")
+
+    # refs are not changed, the next runs do not resolve tags
+    with monkeypatch.context() as context:
+        context.setattr(Git, "_tags_sorted", fake_tags)
+        context.setattr(Git, "_cmd", fake_tags)
+        assert Git.version_current() == "v10.0.0"
+        assert Git.tags()[0] == "v10.0.0"
+
+    git("tag", "v11.0.0", cwd=repo)
+    assert Git.version_current() == "v11.0.0"
+    assert Git.version_current("service_a_") == "service_a_0.1.1"
+    git("tag", "-d", "v11.0.0", cwd=repo)
+    git("pack-refs", "--all", cwd=repo)
+    assert Git.version_current() == "v10.0.0"
+
+    monkeypatch.setattr(Git, "use_cache", False)
+    monkeypatch.setattr(RefsReader, "fingerprint", fake_tags)
+    assert Git.version_current() == "v10.0.0"
+
+
+def test_version_cache_shallow(repo, tmp_path, monkeypatch):
+    monkeypatch.setattr(Git, "use_cache", True)
+    git(
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "-q",
+        "--allow-empty",
+        "-m",
+        "next",
+        cwd=repo,
+    )
+    clone = tmp_path / "clone"
+    git("clone", "-q", "--depth=1", "--no-tags", f"file://{repo}", str(clone), cwd=tmp_path)
+    git("fetch", "-q", "--depth=1", "origin", "tag", "v10.0.0", cwd=clone)
+    monkeypatch.chdir(clone)
+    # the tagged commit is cut off by the shallow history
+    assert Git.version_current() == "v0.0.0"
+
+    # the tags are the same, the 'shallow' file is removed
+    git("fetch", "-q", "--unshallow", "--no-tags", cwd=clone)
+    assert Git.version_current() == "v10.0.0"
+
+
+def test_changelog_note_annotated_tag(repo, monkeypatch):
+    for key in ("GIT_AUTHOR", "GIT_COMMITTER"):
+        monkeypatch.setenv(f"{key}_NAME", "test")
+        monkeypatch.setenv(f"{key}_EMAIL", "test@example.com")
+    # 'v1.0.0-rc1' is an annotated tag, 'v1.0.0' is a lightweight one
+    changelog_group = Git._changelog_group_sort("fix: test fix", True, True)
+    Git.changelog_note_write("v1.0.0-rc1", {"version": "v1.0.0-rc1", **changelog_group})
+    Git.changelog_note_write("v1.0.0", {"version": "v1.0.0", **changelog_group})
+    # the note is attached to the commit, both tags share it
+    notes = git("notes", "--ref=refs/notes/pygitver", "list", cwd=repo).split("\n")
+    assert [line.split(" ")[1] for line in notes] == [git("rev-parse", "HEAD", cwd=repo)]
+    assert Git.changelog_note_read("v1.0.0-rc1")["changelog_group"]["version"] == "v1.0.0-rc1"
+    assert Git.changelog_note_read("v1.0.0")["changelog_group"]["version"] == "v1.0.0"
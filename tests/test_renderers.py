@@ -0,0 +1,103 @@
+import os
+
+import pytest
+from jinja2 import Environment, FileSystemLoader
+
+from pygitver.git import Git
+from pygitver.renderers import (
+    TEMPLATE_CHANGELOG,
+    TEMPLATE_CHANGELOG_COMMON,
+    native_renderer,
+    render_changelog,
+    render_changelogs,
+)
+
+CHANGELOG_FULL = {
+    "features": ["new api", "allow to trigger job manually"],
+    "bugfixes": ["test fix 1"],
+    "deprecations": ["deprecated api"],
+    "others": ["code refactoring", "CI update"],
+    "docs": ["update README.md"],
+    "non_conventional_commit": ["some non-conventional commit"],
+}
+CHANGELOG_PARTIAL = {
+    "features": [],
+    "bugfixes": ["fix"],
+    "deprecations": [],
+    "others": ["refactoring"],
+    "docs": [],
+    "non_conventional_commit": [],
+}
+CHANGELOG_EMPTY = {section: [] for section in CHANGELOG_FULL}
+
+
+def jinja_render(template_name: str, context: dict) -> str:
+    env = Environment(loader=FileSystemLoader(os.path.dirname(template_name)))
+    return env.get_template(os.path.basename(template_name)).render(**context)
+
+
+@pytest.mark.parametrize(
+    "context",
+    [
+        {"version": "v1.2.3", **CHANGELOG_FULL},
+        {"version": "v0.0.1", **CHANGELOG_PARTIAL},
+        {"version": "v0.0.1", **CHANGELOG_EMPTY},
+        {"version": "v2.0.0", "date": "2024-01-02", **CHANGELOG_PARTIAL},
+        {"version": "v2.0.0", "maintainer": "John Doe", **CHANGELOG_FULL},
+        {"version": None},
+        {"version": "v3.0.0", **CHANGELOG_PARTIAL, "totals": {"bugfixes": 1235, "others": 1}},
+    ],
+)
+def test_render_changelog(context):
+    assert render_changelog(context) == jinja_render(TEMPLATE_CHANGELOG, context)
+
+
+@pytest.mark.parametrize(
+    "context",
+    [
+        {"version": "0.0.1", "services": {}},
+        {
+            "version": "1.1.0",
+            "date": "2024-01-02",
+            "maintainer": "John Doe",
+            "services": {
+                "service_a": {"version": "v1.0.0", "changelog": CHANGELOG_FULL},
+                "service_b": {"version": "v0.1.0", "changelog": CHANGELOG_PARTIAL},
+                "service_c": {"version": "v0.0.1", "changelog": CHANGELOG_EMPTY},
+            },
+        },
+        {
+            "version": "1.2.0",
+            "services": {"service_a": {"version": "v1.0.0", "changelog": CHANGELOG_PARTIAL}},
+            "unchanged": {"service_b": "v0.1.0", "service_c": "v0.0.1"},
+        },
+        {
+            "version": "1.3.0",
+            "services": {
+                "service_a": {"version": "v1.0.0", "changelog": CHANGELOG_FULL,
+                              "totals": {"features": 2, "docs": 1001, "deprecations": 0}},
+            },
+        },
+    ],
+)
+def test_render_changelogs(context):
+    assert render_changelogs(context) == jinja_render(
+        TEMPLATE_CHANGELOG_COMMON, context
+    )
+
+
+def test_native_renderer():
+    assert native_renderer(TEMPLATE_CHANGELOG) is render_changelog
+    assert native_renderer(TEMPLATE_CHANGELOG_COMMON) is render_changelogs
+    assert native_renderer("src/pygitver/templates/changelog.tmpl") is render_changelog
+    assert native_renderer("custom/changelog.tmpl") is None
+    assert native_renderer("tests/custom.tmpl") is None
+
+
+def test_changelog_generate_custom_template(tmp_path):
+    (tmp_path / "custom.tmpl").write_text("{{ version }}: {{ features | join(', ') }}")
+    changelog_group = {"version": "v1.0.0", "changelog": CHANGELOG_FULL}
+    output = Git.changelog_generate(
+        changelog_group, template_name=str(tmp_path / "custom.tmpl")
+    )
+    assert output == "v1.0.0: new api, allow to trigger job manually"
@@ -0,0 +1,129 @@
+import errno
+import json
+
+import pytest
+
+from pygitver.git import Git, GitError
+from pygitver import watcher as watcher_module
+from pygitver.watcher import ChangelogWatcher, ChangelogWatcherError
+
+
+class FakeRepo:
+    def __init__(self):
+        self.head = "sha1"
+        self.tags = "sha0:refs/tags/v1.0.0\n"
+        self.version = "v1.0.0"
+        self.commits = {"sha1": "fix: test fix 1"}
+        self.rewritten = False
+        self.calls = []
+
+    def cmd(self, command: str) -> str:
+        self.calls.append(command)
+        if command == "git rev-parse HEAD":
+            return f"{self.head}\n"
+        if command.startswith("git for-each-ref"):
+            return self.tags
+        if command.startswith("git merge-base --is-ancestor"):
+            if self.rewritten:
+                raise GitError(json.dumps({"return_code": 1, "result": ""}))
+            return ""
+        if command.startswith("git log --pretty=format:%s"):
+            return self.log(command)
+        return ""
+
+    def log(self, command: str) -> str:
+        shas = list(self.commits.keys())
+        if ".." in command and "..." not in command:
+            old = command.split(" ")[3].split("..")[0]
+            shas = shas[shas.index(old) + 1:]
+        return "\n".join(self.commits[sha] for sha in reversed(shas))
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    fake_repo = FakeRepo()
+    monkeypatch.setattr(Git, "_cmd", value=fake_repo.cmd)
+    monkeypatch.setattr(Git, "version_current", value=lambda: fake_repo.version)
+    monkeypatch.setattr(Git, "changelog", value=lambda *args, **kwargs: fake_repo.log(""))
+    return fake_repo
+
+
+def test_watcher_requires_output():
+    with pytest.raises(ChangelogWatcherError):
+        ChangelogWatcher()
+
+
+def test_watcher_refresh(repo, tmp_path):
+    output_json = str(tmp_path / "changelog.json")
+    watcher = ChangelogWatcher(output_json=output_json)
+
+    assert watcher.refresh() is True
+    assert watcher.changelog_group["version"] == "v1.0.1"
+    assert watcher.refresh() is False
+
+    # a new commit: only the delta is classified
+    repo.commits["sha2"] = "feat(api): new api"
+    repo.head = "sha2"
+    repo.calls.clear()
+    assert watcher.refresh() is True
+    assert "git log --pretty=format:%s sha1..sha2 --no-merges" in repo.calls
+    with open(output_json) as fp:
+        res = json.load(fp)
+    assert res["version"] == "v1.1.0"
+    assert res["changelog"]["features"] == ["new api"]
+    assert res["changelog"]["bugfixes"] == ["test fix 1"]
+    assert res == Git.changelog_group(unique=True)
+
+    # history was rewritten: the whole range is classified again
+    repo.commits = {"sha3": "docs: update doc"}
+    repo.head = "sha3"
+    repo.rewritten = True
+    assert watcher.refresh() is True
+    assert watcher.changelog_group["changelog"]["docs"] == ["update doc"]
+    assert watcher.changelog_group["changelog"]["features"] == []
+
+    # a new release tag restarts the changelog
+    repo.commits = {}
+    repo.tags += "sha3:refs/tags/v1.0.2\n"
+    repo.version = "v1.0.2"
+    assert watcher.refresh() is True
+    assert watcher.changelog_group["version"] == "v1.0.2"
+
+
+def test_watcher_run(repo, tmp_path):
+    output_text = str(tmp_path / "CHANGELOG.rst")
+    watcher = ChangelogWatcher(output_text=output_text,
+                               template_name="src/pygitver/templates/changelog.tmpl",
+                               interval=0,
+                               use_inotify=False)
+    watcher.run(max_updates=1)
+    with open(output_text) as fp:
+        assert "* Test fix 1" in fp.read()
+
+
+def test_watcher_run_inotify_error(repo, tmp_path, monkeypatch):
+    closed = []
+
+    class FakeInotify:
+        def add_watch(self, path):
+            raise OSError(errno.ENOSPC, "No space left on device", path)
+
+        def wait(self, timeout):
+            raise AssertionError("inotify is used")
+
+        def close(self):
+            closed.append(True)
+
+    def fake_sleep(seconds):
+        repo.commits["sha2"] = "feat(api): new api"
+        repo.head = "sha2"
+
+    monkeypatch.setattr(watcher_module, "_Inotify", FakeInotify)
+    monkeypatch.setattr(watcher_module.time, "sleep", fake_sleep)
+    monkeypatch.setattr(Git, "git_dirs", lambda: (str(tmp_path), str(tmp_path)))
+    watcher = ChangelogWatcher(output_json=str(tmp_path / "changelog.json"), interval=0)
+
+    # the watches can not be added: the inotify fd is closed, refs are polled
+    watcher.run(max_updates=2)
+    assert closed == [True]
+    assert watcher.changelog_group["version"] == "v1.1.0"